@@ -0,0 +1,131 @@
+"""Benchmark harness of the `when` interception path.
+
+Every benchmark reports the best time per operation out of several
+rounds. Results are written as JSON with --when-bench-json, and each
+result is checked against the upper bound from thresholds.json, so a
+regression in the matcher fails the benchmark.
+"""
+
+from __future__ import annotations
+
+import json
+import pathlib
+import sys
+import timeit
+
+from typing import TYPE_CHECKING, Any
+
+import pytest
+
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+
+THRESHOLDS_PATH = pathlib.Path(__file__).parent / "thresholds.json"
+
+results_key = pytest.StashKey[list[dict[str, Any]]]()
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    group = parser.getgroup("when benchmarks")
+    group.addoption(
+        "--when-bench-json",
+        default=None,
+        type=pathlib.Path,
+        help="Write the benchmark results to the given JSON file.",
+    )
+    group.addoption(
+        "--when-bench-thresholds",
+        default=THRESHOLDS_PATH,
+        type=pathlib.Path,
+        help="JSON file mapping benchmark names to max us per operation.",
+    )
+    group.addoption(
+        "--when-bench-threshold-factor",
+        default=1.0,
+        type=float,
+        help="Scale the thresholds, e.g. for slower machines.",
+    )
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    config.stash[results_key] = []
+
+
+def pytest_sessionfinish(session: pytest.Session) -> None:
+    path = session.config.getoption("when_bench_json")
+    if path is not None:
+        path.write_text(
+            json.dumps(
+                {
+                    "python": sys.version,
+                    "results": session.config.stash[results_key],
+                },
+                indent=2,
+            )
+        )
+
+
+@pytest.fixture(scope="session")
+def thresholds(pytestconfig: pytest.Config) -> dict[str, float]:
+    path = pytestconfig.getoption("when_bench_thresholds")
+    factor = pytestconfig.getoption("when_bench_threshold_factor")
+    return {
+        name: threshold * factor
+        for name, threshold in json.loads(path.read_text()).items()
+    }
+
+
+class Bench:
+    def __init__(
+        self,
+        name: str,
+        results: list[dict[str, Any]],
+        threshold: float | None,
+    ) -> None:
+        self.name = name
+        self.results = results
+        self.threshold = threshold
+
+    def __call__(
+        self,
+        func: Callable[[], Any],
+        *,
+        number: int,
+        repeat: int = 5,
+    ) -> float:
+        """Return the best us per operation, checking the threshold."""
+        us_per_op = (
+            min(timeit.repeat(func, number=number, repeat=repeat))
+            / number
+            * 1e6
+        )
+        self.results.append(
+            {
+                "name": self.name,
+                "us_per_op": us_per_op,
+                "number": number,
+                "repeat": repeat,
+                "threshold": self.threshold,
+            }
+        )
+        sys.stdout.write(f"\n{self.name}: {us_per_op:.2f} us per op\n")
+        if self.threshold is not None:
+            assert us_per_op <= self.threshold, (
+                f"{self.name} regressed: {us_per_op:.2f} us per op, "
+                f"threshold is {self.threshold:.2f} us"
+            )
+        return us_per_op
+
+
+@pytest.fixture
+def bench(
+    request: pytest.FixtureRequest,
+    thresholds: dict[str, float],
+) -> Bench:
+    return Bench(
+        request.node.name,
+        request.config.stash[results_key],
+        thresholds.get(request.node.name),
+    )
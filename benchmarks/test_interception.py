@@ -0,0 +1,234 @@
+"""Benchmarks of the `when` interception path.
+
+Not a part of the test suite, run them explicitly with:
+
+    pytest benchmarks/ --when-bench-json=benchmarks/results.json
+"""
+
+from __future__ import annotations
+
+import inspect
+
+from typing import Any
+
+import pytest
+
+from pytest_when.when import (
+    Markers,
+    MockedCalls,
+    MockedCallsIndex,
+    When,
+    create_call_key,
+    get_mocked_call_result,
+)
+
+
+def positional(a, b, c, d): ...
+
+
+def keyword(*, a, b, c, d): ...
+
+
+def variadic(*args, **kwargs): ...
+
+
+SIGNATURE_KINDS = {
+    "positional": positional,
+    "keyword": keyword,
+    "variadic": variadic,
+}
+
+
+def make_call(kind: str, value: Any) -> tuple[tuple, dict[str, Any]]:
+    if kind == "positional":
+        return (value, 1, 2, 3), {}
+    if kind == "keyword":
+        return (), {"a": value, "b": 1, "c": 2, "d": 3}
+    # make_hashable doesn't recurse into *args, pass the value by keyword
+    return (1, 2), {"c": value, "d": 3}
+
+
+def make_payload(depth: int) -> Any:
+    payload: Any = 0
+    for level in range(depth):
+        payload = {"level": level, "items": [payload, payload, payload]}
+    return payload
+
+
+def make_target(number: int) -> type:
+    return type(f"Target{number}", (), {"method": staticmethod(positional)})
+
+
+@pytest.mark.parametrize("depth", [0, 2, 4])
+@pytest.mark.parametrize("kind", list(SIGNATURE_KINDS))
+def test_create_call_key(bench, kind, depth):
+    signature = inspect.signature(SIGNATURE_KINDS[kind])
+    args, kwargs = make_call(kind, make_payload(depth))
+    bench(
+        lambda: create_call_key(signature, *args, **kwargs),
+        number=1_000,
+    )
+
+
+@pytest.mark.parametrize("stubs", [1, 10, 100, 1_000])
+@pytest.mark.parametrize("path", ["hit", "miss", "wildcard"])
+def test_get_mocked_call_result(bench, path, stubs):
+    signature = inspect.signature(positional)
+    mocked_calls = MockedCallsIndex(signature)
+    for value in range(stubs):
+        mocked_call = (
+            (value, Markers.any, 2, 3)
+            if path == "wildcard"
+            else (value, 1, 2, 3)
+        )
+        mocked_calls[create_call_key(signature, *mocked_call)] = lambda: None
+    # hit the last registered mocked call, so the wildcard path scans all
+    value = -1 if path == "miss" else stubs - 1
+    bench(
+        lambda: get_mocked_call_result(
+            signature, mocked_calls, value, 1, 2, 3
+        ),
+        number=1_000,
+    )
+
+
+@pytest.mark.parametrize("marker", ["equal", "same", "same_content"])
+def test_large_argument(bench, marker):
+    signature = inspect.signature(positional)
+    mocked_calls = MockedCallsIndex(signature)
+    payload = make_payload(6)
+    mocked_value = {
+        "equal": payload,
+        "same": Markers.same(payload),
+        "same_content": Markers.same_content(payload),
+    }[marker]
+    mocked_calls[create_call_key(signature, 0, mocked_value, 2, 3)] = (
+        lambda: None
+    )
+    bench(
+        lambda: get_mocked_call_result(
+            signature, mocked_calls, 0, payload, 2, 3
+        ),
+        number=1_000,
+    )
+
+
+@pytest.mark.parametrize("stubs", [1, 10, 100])
+def test_add_call(bench, mocker, stubs):
+    target = make_target(0)
+
+    def add_calls() -> None:
+        mocked_calls: MockedCalls = MockedCalls(mocker)
+        for value in range(stubs):
+            mocked_calls.add_call(
+                target,
+                "method",
+                (value, 1, 2, 3),
+                {},
+                lambda: None,
+            )
+        mocked_calls.clear()
+
+    bench(add_calls, number=20)
+
+
+@pytest.mark.parametrize("rows", [100, 1_000])
+@pytest.mark.parametrize("api", ["chained", "table"])
+def test_called_with_table(bench, mocker, api, rows):
+    target = make_target(0)
+
+    def add_rows() -> None:
+        when = When(mocker)
+        if api == "table":
+            when(target, "method").called_with_table(
+                ((value, 1, 2, 3), {}, value) for value in range(rows)
+            )
+        else:
+            for value in range(rows):
+                when(target, "method").called_with(value, 1, 2, 3).then_return(
+                    value
+                )
+        when.mocked_calls.clear()
+
+    bench(add_rows, number=1, repeat=3)
+
+
+@pytest.mark.parametrize("targets", [1, 10, 100])
+def test_repatching(bench, when, targets):
+    patched_targets = [make_target(number) for number in range(targets)]
+    for target in patched_targets:
+        when(target, "method").called_with(1, 1, 2, 3).then_return(None)
+    bench(
+        lambda: when(patched_targets[-1], "method")
+        .called_with(1, 1, 2, 3)
+        .then_return(None),
+        number=1_000,
+    )
+
+
+@pytest.mark.parametrize("calls", [1, 1_000])
+@pytest.mark.parametrize("kind", list(SIGNATURE_KINDS))
+def test_mocked_call(bench, when, kind, calls):
+    target = type(
+        "Target", (), {"method": staticmethod(SIGNATURE_KINDS[kind])}
+    )
+    args, kwargs = make_call(kind, 0)
+    when(target, "method").called_with(*args, **kwargs).then_return("Mocked")
+    bench(lambda: target.method(*args, **kwargs), number=calls)
+
+
+@pytest.mark.parametrize("call_log", [0, 1_000])
+def test_logged_call(bench, mocker, call_log):
+    target = make_target(0)
+    when = When(mocker, call_log=call_log)
+    when(target, "method").called_with(0, 1, 2, 3).then_return("Mocked")
+    try:
+        bench(lambda: target.method(0, 1, 2, 3), number=1_000)
+    finally:
+        when.mocked_calls.clear()
+
+
+@pytest.mark.parametrize("spec", ["mocked", "recorded"])
+def test_verify(bench, when, spec):
+    target = make_target(0)
+    when(target, "method").called_with(0, Markers.any, 2, 3).then_return(None)
+    for value in range(10_000):
+        target.method(0, value, 2, 3)
+    verified = Markers.any if spec == "mocked" else 1
+    bench(
+        lambda: when.verify(target, "method")
+        .called_with(0, verified, 2, 3)
+        .at_least(1),
+        number=10,
+    )
+
+
+@pytest.mark.parametrize("adaptive", [False, True])
+def test_skewed_wildcard_calls(bench, adaptive):
+    signature = inspect.signature(positional)
+    mocked_calls = MockedCallsIndex(
+        signature, profile={} if adaptive else None
+    )
+    for value in range(100):
+        mocked_calls[create_call_key(signature, value, Markers.any, 2, 3)] = (
+            lambda: None
+        )
+    # the calls hit the last registered mocked call, which is scanned
+    # last unless the mocked calls are ordered by their hits
+    call = signature.bind(99, 1, 2, 3)
+    bench(lambda: mocked_calls.match(call), number=1_000)
+
+
+def test_chained_stubs(bench, mocker):
+    target = make_target(0)
+
+    def add_stubs() -> None:
+        when = When(mocker)
+        for value in range(10_000):
+            when(target, "method").called_with(value, 1, 2, 3).then_return(
+                value
+            )
+        when.mocked_calls.clear()
+
+    # the registration of a stub mustn't copy the stubs registered before
+    bench(add_stubs, number=1, repeat=3)
@@ -2,6 +2,8 @@
 
 from __future__ import annotations
 
+import enum
+
 from collections.abc import Callable
 from typing import Any, NewType, Protocol, TypeAlias, TypeVar
 
@@ -15,10 +17,10 @@ class HasNameDunder(Protocol):
 _TargetCls = TypeVar("_TargetCls", bound=HasNameDunder)
 _TargetMethodReturn = TypeVar("_TargetMethodReturn")
 
-_TargetClsName = NewType("_TargetClsName", str)
+_TargetId = NewType("_TargetId", int)
 _TargetMethodName = NewType("_TargetMethodName", str)
 _TargetMethodParams = ParamSpec("_TargetMethodParams")
-_TargetClsMethodKey = tuple[_TargetClsName, _TargetMethodName]
+_TargetClsMethodKey = tuple[_TargetId, _TargetMethodName]
 
 _TargetMethodArgs = tuple[Any, ...]
 _TargetMethodKwargs = dict[str, Any]
@@ -26,3 +28,17 @@ _TargetMethodKwargs = dict[str, Any]
 _CallKeyParamDef = dict[str, Any]
 _CallKey = tuple[tuple[str, Any], ...]
 _CallLazyValue: TypeAlias = Callable[[], _TargetMethodReturn]
+
+
+class Exhausted(enum.Enum):
+    """What the mocked call does once its responses are exhausted.
+
+    Exhausted.error - raise ResponsesExhaustedError
+    Exhausted.repeat_last - return the last response again
+    Exhausted.fall_through - pass the call on to the next matching mocked
+    call, or handle it as a not matched one
+    """
+
+    error = "error"
+    repeat_last = "repeat_last"
+    fall_through = "fall_through"
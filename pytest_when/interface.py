@@ -1,11 +1,16 @@
 import abc
+import inspect
 
-from typing import Generic
+from collections.abc import Callable, Iterable
+from typing import Any, Generic
 from unittest.mock import MagicMock
 
 from pytest_when.constant import (
+    Exhausted,
     _CallLazyValue,
     _TargetCls,
+    _TargetMethodArgs,
+    _TargetMethodKwargs,
     _TargetMethodName,
     _TargetMethodReturn,
 )
@@ -17,6 +22,20 @@ class ThenResponse(abc.ABC, Generic[_TargetMethodReturn,]):
         """Return value in case the called_with specification will match the call."""
         raise NotImplementedError("Not implemented")
 
+    @abc.abstractmethod
+    def then_return_after(
+        self,
+        value: _TargetMethodReturn,
+        delay: float,
+    ) -> MagicMock:
+        """Return value after delay seconds in case the called_with specification will match the call.
+
+        For coroutine functions the delay is awaited with asyncio.sleep,
+        so the other tasks keep running, delay=0 only yields to the event
+        loop once. Other callables sleep with time.sleep.
+        """
+        raise NotImplementedError("Not implemented")
+
     @abc.abstractmethod
     def then_call(self, callable_: _CallLazyValue) -> MagicMock:
         """Call the callable_ in case the called_with specification will match the call.
@@ -32,6 +51,30 @@ class ThenResponse(abc.ABC, Generic[_TargetMethodReturn,]):
         >>>    .then_call(functools.partial(foo_patched, *foo_args, **foo_kwargs)
         >>> )
 
+        For coroutine functions the callable can be a coroutine function
+        too, its result is awaited.
+
+        """
+        raise NotImplementedError("Not implemented")
+
+    @abc.abstractmethod
+    def then_answer(
+        self,
+        answer: Callable[[inspect.BoundArguments], _TargetMethodReturn],
+    ) -> MagicMock:
+        """Call the answer with the matched call and return its result.
+
+        The answer gets the inspect.BoundArguments of the call with the
+        defaults applied, so a single mocked call could compute the result
+        from the arguments instead of listing every call.
+
+        Example:
+        >>> (
+        >>>    when(example_module, "some_normal_function")
+        >>>    .called_with("a", when.markers.any, kwarg1="b", kwarg2="c")
+        >>>    .then_answer(lambda call: f"Mocked {call.arguments['arg2']}")
+        >>> )
+
         """
         raise NotImplementedError("Not implemented")
 
@@ -40,6 +83,34 @@ class ThenResponse(abc.ABC, Generic[_TargetMethodReturn,]):
         """Raise exc in case the called_with specification will match the call."""
         raise NotImplementedError("Not implemented")
 
+    @abc.abstractmethod
+    def then_return_many(
+        self,
+        values: Iterable[_TargetMethodReturn],
+        on_exhausted: Exhausted = Exhausted.error,
+    ) -> MagicMock:
+        """Return the next of values on every call matching the called_with specification.
+
+        The values are consumed lazily, so they could be a generator of
+        responses, which are never built all at once.
+        Once the values are exhausted, depending on on_exhausted, the call
+        raises ResponsesExhaustedError, returns the last value again, or
+        falls through to the original callable like a not matched call.
+
+        Example:
+        >>> when(Client, "get_page").called_with(when.markers.any).then_return_many(
+        >>>     (make_page(number) for number in range(1000)),
+        >>>     on_exhausted=when.exhausted.repeat_last,
+        >>> )
+
+        """
+        raise NotImplementedError("Not implemented")
+
+    @abc.abstractmethod
+    def then_cycle(self, values: Iterable[_TargetMethodReturn]) -> MagicMock:
+        """Return the values in a loop on the calls matching the called_with specification."""
+        raise NotImplementedError("Not implemented")
+
 
 class WhenResponse(abc.ABC):
 
@@ -69,6 +140,53 @@ class WhenResponse(abc.ABC):
         """
         raise NotImplementedError("Not implemented")
 
+    @abc.abstractmethod
+    def called_with_table(
+        self,
+        rows: Iterable[tuple[_TargetMethodArgs, _TargetMethodKwargs, Any]],
+    ) -> MagicMock:
+        """Return the result of the row which args and kwargs match the call.
+
+        The same as the called_with(*args, **kwargs).then_return(result)
+        for every row, but the rows are registered at once and the target
+        is patched only once. If any row doesn't fit the target signature,
+        none is registered.
+
+        Example:
+        >>> when(Klass1, "some_method").called_with_table(
+        >>>     [
+        >>>         (("a", 1), {"kwarg1": "b", "kwarg2": "c"}, "Mocked a"),
+        >>>         (("b", 1), {"kwarg1": "b", "kwarg2": "c"}, "Mocked b"),
+        >>>     ]
+        >>> )
+
+        """
+        raise NotImplementedError("Not implemented")
+
+
+class CalledTimes(abc.ABC):
+    @abc.abstractmethod
+    def times(self, times: int) -> None:
+        """Check the target was called times times with the spec."""
+        raise NotImplementedError("Not implemented")
+
+    @abc.abstractmethod
+    def never(self) -> None:
+        """Check the target was never called with the spec."""
+        raise NotImplementedError("Not implemented")
+
+    @abc.abstractmethod
+    def at_least(self, times: int) -> None:
+        """Check the target was called at least times times with the spec."""
+        raise NotImplementedError("Not implemented")
+
+
+class VerifyResponse(abc.ABC):
+    @abc.abstractmethod
+    def called_with(self, *args, **kwargs) -> CalledTimes:
+        """Specify args and kwargs of the calls to verify."""
+        raise NotImplementedError("Not implemented")
+
 
 class WhenInitial(abc.ABC, Generic[_TargetCls]):
     @abc.abstractmethod
@@ -76,6 +194,8 @@ class WhenInitial(abc.ABC, Generic[_TargetCls]):
         self,
         cls: _TargetCls,
         method: _TargetMethodName,
+        *,
+        strict: bool | None = None,
     ) -> WhenResponse:
         """Patching utility focused on readability.
 
@@ -129,5 +249,34 @@ class WhenInitial(abc.ABC, Generic[_TargetCls]):
 
         You can also patch multiple targets (cls, method)
 
+        With strict=True the calls not matching any "called_with" fail with
+        UnmatchedCallError instead of calling the original, strict=False
+        passes them to the original, None keeps the current mode of the
+        target or the default from the when_strict ini option or marker.
+
+        """
+        raise NotImplementedError("Not implemented")
+
+    @abc.abstractmethod
+    def verify(
+        self,
+        cls: _TargetCls,
+        method: _TargetMethodName,
+    ) -> VerifyResponse:
+        """Verify the calls of cls.method patched by when.
+
+        Example:
+        >>> when.verify(Klass1, "some_method").called_with(
+        >>>     "a",
+        >>>     when.markers.any,
+        >>>     kwarg1="b",
+        >>>     kwarg2="c",
+        >>> ).times(2)
+
+        The calls matching a spec registered with called_with are counted
+        during the interception, so verifying them doesn't scan the calls,
+        unless the other mocked calls could take some of them. The other
+        specs are matched against the calls recorded by the mock.
+
         """
         raise NotImplementedError("Not implemented")
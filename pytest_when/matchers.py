@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import abc
+import dataclasses
+import functools
+import hashlib
+import pickle
+import re
+import threading
+
+from collections.abc import Mapping
+from collections.abc import Set as AbstractSet
+from typing import TYPE_CHECKING, Any, ClassVar
+
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Hashable
+
+
+class ArgumentMatcher(abc.ABC):
+    """Matcher of a single argument of the mocked call.
+
+    The cost orders the checks of a mocked call, the cheap matchers are
+    checked first, so the expensive ones run only for the calls which
+    passed all the others. The matchers get the argument as it was
+    passed, unless it is nested in a container.
+    """
+
+    cost: ClassVar[int]
+
+    @abc.abstractmethod
+    def matches(self, value: Any) -> bool:
+        """Check if the argument matches."""
+
+
+@dataclasses.dataclass(frozen=True, eq=False)
+class Same(ArgumentMatcher):
+    cost: ClassVar[int] = 0
+
+    obj: Any
+
+    def __eq__(self, other: object) -> bool:
+        return type(other) is Same and other.obj is self.obj
+
+    def __hash__(self) -> int:
+        return id(self.obj)
+
+    def matches(self, value: Any) -> bool:
+        return value is self.obj
+
+
+@dataclasses.dataclass(frozen=True)
+class InstanceOf(ArgumentMatcher):
+    cost: ClassVar[int] = 1
+
+    types: tuple[type, ...]
+
+    def matches(self, value: Any) -> bool:
+        return isinstance(value, self.types)
+
+
+@dataclasses.dataclass(frozen=True)
+class Between(ArgumentMatcher):
+    cost: ClassVar[int] = 2
+
+    low: Any
+    high: Any
+
+    def matches(self, value: Any) -> bool:
+        try:
+            return bool(self.low <= value <= self.high)
+        except TypeError:
+            return False
+
+
+@dataclasses.dataclass(frozen=True)
+class Matches(ArgumentMatcher):
+    cost: ClassVar[int] = 3
+
+    pattern: re.Pattern
+
+    def matches(self, value: Any) -> bool:
+        try:
+            return self.pattern.search(value) is not None
+        except TypeError:
+            return False
+
+
+@dataclasses.dataclass(frozen=True)
+class Satisfies(ArgumentMatcher):
+    cost: ClassVar[int] = 4
+
+    predicate: Callable[[Any], bool]
+
+    def matches(self, value: Any) -> bool:
+        return bool(self.predicate(value))
+
+
+# the digests of the last call arguments kept by SameContent, the
+# arguments are kept alive, so their ids are not reused
+MAX_CACHED_DIGESTS = 16
+
+
+@dataclasses.dataclass(frozen=True)
+class SameContent(ArgumentMatcher):
+    cost: ClassVar[int] = 5
+
+    expected: Hashable
+    digest: Callable[[Any], Hashable]
+    digests: dict[int, tuple[Any, Hashable]] = dataclasses.field(
+        default_factory=dict,
+        compare=False,
+        repr=False,
+    )
+    lock: threading.Lock = dataclasses.field(
+        default_factory=threading.Lock,
+        compare=False,
+        repr=False,
+    )
+
+    def matches(self, value: Any) -> bool:
+        cached = self.digests.get(id(value))
+        if cached is not None and cached[0] is value:
+            return cached[1] == self.expected
+        try:
+            digest = self.digest(value)
+        except (AttributeError, TypeError, ValueError, pickle.PicklingError):
+            return False
+        with self.lock:
+            if len(self.digests) >= MAX_CACHED_DIGESTS:
+                del self.digests[next(iter(self.digests))]
+            self.digests[id(value)] = (value, digest)
+        return digest == self.expected
+
+
+def content_digest(value: Any) -> bytes:
+    """Digest the buffer of value, or its pickle if it has no buffer.
+
+    The buffer is digested with its format and shape, so the arrays of
+    the same bytes, but of different dtypes or shapes, differ. The
+    mappings and sets are pickled in a canonical order, see canonical.
+    """
+    try:
+        buffer = memoryview(value)
+    except TypeError:
+        return hashlib.blake2b(pickle_canonical(value)).digest()
+    with buffer:
+        digest = hashlib.blake2b(f"{buffer.format}:{buffer.shape}".encode())
+        digest.update(buffer if buffer.c_contiguous else buffer.tobytes())
+    return digest.digest()
+
+
+def pickle_canonical(value: Any) -> bytes:
+    return pickle.dumps(canonical(value), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def get_type_name(value: Any) -> str:
+    return f"{type(value).__module__}.{type(value).__qualname__}"
+
+
+@functools.singledispatch
+def canonical(value: Any) -> Any:
+    """Return the form of value to pickle, alike for the equal contents.
+
+    The items of the mappings and the sets, also nested in the lists and
+    tuples, are sorted by their pickles, so the pickle doesn't depend on
+    the order of their insertion. The other values are pickled as they
+    are.
+    """
+    return value
+
+
+@canonical.register
+def _(value: Mapping) -> tuple[str, list[tuple[bytes, Any]]]:
+    return (
+        get_type_name(value),
+        sorted(
+            (
+                (pickle_canonical(key), canonical(item))
+                for key, item in value.items()
+            ),
+            key=lambda pickled_item: pickled_item[0],
+        ),
+    )
+
+
+@canonical.register
+def _(value: AbstractSet) -> tuple[str, list[bytes]]:
+    return (get_type_name(value), sorted(map(pickle_canonical, value)))
+
+
+@canonical.register(list)
+@canonical.register(tuple)
+def _(value: list[Any] | tuple[Any, ...]) -> tuple[str, list[Any]]:
+    return (get_type_name(value), [canonical(item) for item in value])
+
+
+def same(obj: Any) -> Same:
+    """Match the argument which is obj itself, compared by identity."""
+    return Same(obj)
+
+
+def same_content(
+    obj: Any,
+    digest: Callable[[Any], Hashable] = content_digest,
+) -> SameContent:
+    """Match the arguments of the same digest as obj.
+
+    The digest of obj is computed once, and the digest of an argument
+    once per object for the last MAX_CACHED_DIGESTS arguments, so the
+    arguments mustn't be mutated in between the calls.
+    """
+    return SameContent(digest(obj), digest)
+
+
+def instance_of(*types: type) -> InstanceOf:
+    """Match the arguments which are instances of any of the types."""
+    return InstanceOf(types)
+
+
+def between(low: Any, high: Any) -> Between:
+    """Match the arguments from low to high, both included."""
+    return Between(low, high)
+
+
+def matches(pattern: str | bytes | re.Pattern) -> Matches:
+    """Match the strings, or bytes, in which the pattern is found."""
+    return Matches(re.compile(pattern))
+
+
+def satisfies(predicate: Callable[[Any], bool]) -> Satisfies:
+    """Match the arguments for which the predicate is true."""
+    return Satisfies(predicate)
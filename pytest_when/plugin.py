@@ -1,3 +1,209 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+
+import pytest
+
+from pytest_when.stats import (
+    RegistryStats,
+    SessionStats,
+    StubProfile,
+    TargetTotals,
+    registry_stats_key,
+    session_stats_key,
+    stub_profile_key,
+)
+
+
+if TYPE_CHECKING:
+    from xdist.workermanage import WorkerController
+
+
 pytest_plugins = [
     "pytest_when.when",
 ]
+
+MAX_REPORTED_FALLTHROUGHS = 20
+
+# keys of the stats sent from the pytest-xdist workers to the controller
+REGISTRY_STATS_OUTPUT = "when_registry_stats"
+SESSION_STATS_OUTPUT = "when_stats"
+STUB_PROFILE_OUTPUT = "when_stub_profile"
+
+# the pytest cache key of the StubProfile hits
+STUB_PROFILE_CACHE_KEY = "when/stub_profile"
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    group = parser.getgroup("when")
+    group.addoption(
+        "--when-registry-stats",
+        action="store_true",
+        default=False,
+        help="Report the peak size of the when mocked calls registry.",
+    )
+    group.addoption(
+        "--when-stats",
+        action="store_true",
+        default=False,
+        help=(
+            "Count and time the calls to the targets patched by when, "
+            "available as the when_stats attribute of the returned mocks "
+            "and reported in the terminal summary."
+        ),
+    )
+    parser.addini(
+        "when_strict",
+        type="bool",
+        default=False,
+        help=(
+            "Fail the calls to the targets patched by when which don't "
+            "match any mocked call instead of calling the original."
+        ),
+    )
+    parser.addini(
+        "when_adaptive",
+        type="bool",
+        default=False,
+        help=(
+            "Check the mocked calls which can't match the same calls in the "
+            "order of their hits, saved in the pytest cache between the "
+            "sessions."
+        ),
+    )
+    parser.addini(
+        "when_call_log",
+        default="0",
+        help=(
+            "Log the given number of the last calls to every target patched "
+            "by when compactly, as the when_call_log attribute of the "
+            "returned mocks, which don't keep the calls then. 0 disables."
+        ),
+    )
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    config.addinivalue_line(
+        "markers",
+        "when_strict(strict=True): fail the calls to the targets patched by "
+        "when which don't match any mocked call, overrides the when_strict "
+        "ini option.",
+    )
+    if config.getoption("when_registry_stats"):
+        config.stash[registry_stats_key] = RegistryStats()
+    if config.getoption("when_stats"):
+        config.stash[session_stats_key] = SessionStats()
+    if config.getini("when_adaptive"):
+        cache = getattr(config, "cache", None)
+        config.stash[stub_profile_key] = StubProfile(
+            previous=(
+                {} if cache is None else cache.get(STUB_PROFILE_CACHE_KEY, {})
+            ),
+        )
+
+
+def pytest_sessionfinish(session: pytest.Session) -> None:
+    workeroutput: dict[str, Any] | None = getattr(
+        session.config, "workeroutput", None
+    )
+    stub_profile = session.config.stash.get(stub_profile_key, None)
+    if workeroutput is None:
+        cache = getattr(session.config, "cache", None)
+        if stub_profile is not None and cache is not None:
+            cache.set(STUB_PROFILE_CACHE_KEY, stub_profile.saved())
+        return
+    if stub_profile is not None:
+        workeroutput[STUB_PROFILE_OUTPUT] = stub_profile.dump()
+    registry_stats = session.config.stash.get(registry_stats_key, None)
+    if registry_stats is not None:
+        workeroutput[REGISTRY_STATS_OUTPUT] = registry_stats.dump()
+    session_stats = session.config.stash.get(session_stats_key, None)
+    if session_stats is not None:
+        workeroutput[SESSION_STATS_OUTPUT] = session_stats.dump()
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node: WorkerController) -> None:
+    """Merge the stats of a finished pytest-xdist worker."""
+    workeroutput: dict[str, Any] = getattr(node, "workeroutput", {})
+    registry_stats = node.config.stash.get(registry_stats_key, None)
+    if registry_stats is not None and REGISTRY_STATS_OUTPUT in workeroutput:
+        registry_stats.merge(workeroutput[REGISTRY_STATS_OUTPUT])
+    session_stats = node.config.stash.get(session_stats_key, None)
+    if session_stats is not None and SESSION_STATS_OUTPUT in workeroutput:
+        session_stats.merge(
+            node.workerinput["workerid"],
+            workeroutput[SESSION_STATS_OUTPUT],
+        )
+    stub_profile = node.config.stash.get(stub_profile_key, None)
+    if stub_profile is not None and STUB_PROFILE_OUTPUT in workeroutput:
+        stub_profile.merge(workeroutput[STUB_PROFILE_OUTPUT])
+
+
+def report_registry_stats(
+    terminalreporter: pytest.TerminalReporter,
+    registry_stats: RegistryStats,
+) -> None:
+    terminalreporter.write_sep("-", "pytest-when registry")
+    terminalreporter.write_line(
+        f"peak registry size: {registry_stats.peak_size} mocked calls"
+        + (
+            f" ({registry_stats.peak_nodeid})"
+            if registry_stats.peak_nodeid
+            else ""
+        )
+    )
+
+
+def format_totals(totals: TargetTotals, name: str) -> str:
+    return (
+        f"{totals.calls:>8} {totals.misses:>8} "
+        f"{totals.fallthroughs:>8} {totals.stubs:>6} "
+        f"{totals.dead_stubs:>6} {totals.matching_time * 1e3:>9.2f} "
+        f"{totals.stubs_time * 1e3:>9.2f} "
+        f"{totals.original_time * 1e3:>9.2f} {name}"
+    )
+
+
+def report_session_stats(
+    terminalreporter: pytest.TerminalReporter,
+    session_stats: SessionStats,
+) -> None:
+    terminalreporter.write_sep("-", "pytest-when stats")
+    terminalreporter.write_line(
+        f"{'calls':>8} {'misses':>8} {'fallthr':>8} {'stubs':>6} "
+        f"{'dead':>6} {'match ms':>9} {'stubs ms':>9} {'orig ms':>9} "
+        "target"
+    )
+    for name, totals in sorted(
+        session_stats.targets.items(),
+        key=lambda target: (-target[1].fallthroughs, -target[1].calls),
+    ):
+        terminalreporter.write_line(format_totals(totals, name))
+    if session_stats.workers:
+        terminalreporter.write_line("per worker:")
+        for worker_id, totals in sorted(
+            session_stats.workers.items(),
+            key=lambda worker: -worker[1].matching_time,
+        ):
+            terminalreporter.write_line(format_totals(totals, worker_id))
+    if not session_stats.fallthroughs:
+        return
+    terminalreporter.write_line("calls passed to the original callable:")
+    for (nodeid, name), fallthroughs in sorted(
+        session_stats.fallthroughs.items(),
+        key=lambda fallthrough: -fallthrough[1],
+    )[:MAX_REPORTED_FALLTHROUGHS]:
+        terminalreporter.write_line(f"  {nodeid}: {name} x{fallthroughs}")
+
+
+def pytest_terminal_summary(
+    terminalreporter: pytest.TerminalReporter,
+    config: pytest.Config,
+) -> None:
+    registry_stats = config.stash.get(registry_stats_key, None)
+    if registry_stats is not None:
+        report_registry_stats(terminalreporter, registry_stats)
+    session_stats = config.stash.get(session_stats_key, None)
+    if session_stats is not None:
+        report_session_stats(terminalreporter, session_stats)
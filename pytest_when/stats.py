@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import dataclasses
+
+from typing import TYPE_CHECKING, Any
+
+import pytest
+
+
+if TYPE_CHECKING:
+    from collections.abc import Hashable, Iterable
+
+
+@dataclasses.dataclass
+class RegistryStats:
+    """Peak size of the mocked calls registry over the session."""
+
+    peak_size: int = 0
+    peak_nodeid: str | None = None
+
+    def update(self, size: int, nodeid: str | None) -> None:
+        if size > self.peak_size:
+            self.peak_size = size
+            self.peak_nodeid = nodeid
+
+    def dump(self) -> dict[str, Any]:
+        """Serialize for sending from a pytest-xdist worker."""
+        return dataclasses.asdict(self)
+
+    def merge(self, dumped: dict[str, Any]) -> None:
+        """Merge the stats dumped by a pytest-xdist worker."""
+        self.update(dumped["peak_size"], dumped["peak_nodeid"])
+
+
+class StubStats:
+    """Counters of a single mocked call.
+
+    The times are measured only if --when-stats is set, in seconds:
+    - matches - calls answered by the mocked call
+    - fallthroughs - calls matched, but passed on by its lazy value
+    - misses - calls of the target since the registration not matched
+    - matching_time - time spent in searching for the matched calls
+    - time - time spent in the lazy value
+    """
+
+    __slots__ = (
+        "calls_before",
+        "fallthroughs",
+        "matches",
+        "matching_time",
+        "target",
+        "time",
+    )
+
+    def __init__(self) -> None:
+        self.matches = 0
+        self.fallthroughs = 0
+        self.matching_time = 0.0
+        self.time = 0.0
+        self.target: TargetStats | None = None
+        self.calls_before = 0
+
+    def count_misses(self, target: TargetStats) -> None:
+        """Count the misses from the calls counted by target from now on.
+
+        The calls already seen by the previous target are kept.
+        """
+        self.calls_before = target.calls - self.calls_seen
+        self.target = target
+
+    @property
+    def calls_seen(self) -> int:
+        """Calls of the target since the registration."""
+        if self.target is None:
+            return 0
+        return self.target.calls - self.calls_before
+
+    @property
+    def misses(self) -> int:
+        return self.calls_seen - self.matches - self.fallthroughs
+
+
+class TargetStats:
+    """Counters of the calls to a single patched target.
+
+    The calls are always counted, but timed only if --when-stats is set,
+    times are in seconds:
+    - calls - all the calls to the target
+    - misses - calls which didn't match any mocked call
+    - fallthroughs - misses passed to the original callable
+    - matching_time - time spent in searching for the mocked call
+    - stubs_time - time spent in the lazy values of the mocked calls
+    - original_time - time spent in the original callable
+    """
+
+    __slots__ = (
+        "calls",
+        "fallthroughs",
+        "matching_time",
+        "misses",
+        "name",
+        "original_time",
+        "stubs",
+        "stubs_time",
+    )
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.calls = 0
+        self.misses = 0
+        self.fallthroughs = 0
+        self.matching_time = 0.0
+        self.stubs_time = 0.0
+        self.original_time = 0.0
+        self.stubs: dict[Hashable, StubStats] = {}
+
+    def stub_misses(self, call_key: Hashable) -> int:
+        """Count the calls which the mocked call didn't match."""
+        return self.stubs[call_key].misses
+
+
+@dataclasses.dataclass
+class TargetTotals:
+    """TargetStats of a target summed over the tests."""
+
+    calls: int = 0
+    misses: int = 0
+    fallthroughs: int = 0
+    stubs: int = 0
+    dead_stubs: int = 0
+    matching_time: float = 0.0
+    stubs_time: float = 0.0
+    original_time: float = 0.0
+
+    def add(self, stats: TargetStats) -> None:
+        self.calls += stats.calls
+        self.misses += stats.misses
+        self.fallthroughs += stats.fallthroughs
+        self.stubs += len(stats.stubs)
+        self.dead_stubs += sum(
+            1 for stub in stats.stubs.values() if not stub.matches
+        )
+        self.matching_time += stats.matching_time
+        self.stubs_time += stats.stubs_time
+        self.original_time += stats.original_time
+
+    def merge(self, totals: TargetTotals) -> None:
+        for field in dataclasses.fields(self):
+            setattr(
+                self,
+                field.name,
+                getattr(self, field.name) + getattr(totals, field.name),
+            )
+
+
+@dataclasses.dataclass
+class SessionStats:
+    """TargetStats collected over the session for the terminal summary.
+
+    Only the totals are kept, so no mocked call outlives its test.
+    Under pytest-xdist the controller merges the stats of the workers
+    and keeps the totals of every worker as well.
+    """
+
+    targets: dict[str, TargetTotals] = dataclasses.field(
+        default_factory=dict,
+    )
+    fallthroughs: dict[tuple[str, str], int] = dataclasses.field(
+        default_factory=dict,
+    )
+    workers: dict[str, TargetTotals] = dataclasses.field(
+        default_factory=dict,
+    )
+
+    def add(self, nodeid: str, targets_stats: Iterable[TargetStats]) -> None:
+        for stats in targets_stats:
+            self.targets.setdefault(stats.name, TargetTotals()).add(stats)
+            if stats.fallthroughs:
+                self.fallthroughs[(nodeid, stats.name)] = stats.fallthroughs
+
+    def dump(self) -> dict[str, Any]:
+        """Serialize for sending from a pytest-xdist worker."""
+        return {
+            "targets": {
+                name: dataclasses.asdict(totals)
+                for name, totals in self.targets.items()
+            },
+            "fallthroughs": [
+                [nodeid, name, fallthroughs]
+                for (nodeid, name), fallthroughs in self.fallthroughs.items()
+            ],
+        }
+
+    def merge(self, worker_id: str, dumped: dict[str, Any]) -> None:
+        """Merge the stats dumped by a pytest-xdist worker."""
+        worker = self.workers.setdefault(worker_id, TargetTotals())
+        for name, fields in dumped["targets"].items():
+            totals = TargetTotals(**fields)
+            self.targets.setdefault(name, TargetTotals()).merge(totals)
+            worker.merge(totals)
+        for nodeid, name, fallthroughs in dumped["fallthroughs"]:
+            self.fallthroughs[(nodeid, name)] = fallthroughs
+
+
+@dataclasses.dataclass
+class StubProfile:
+    """Calls matched by the mocked calls, saved between the sessions.
+
+    The hits of the previous session order the mocked calls of the
+    targets from their first call, the hits of this session are saved
+    for the next one. The mocked calls are identified by a digest of
+    their call keys and grouped by the target name.
+    """
+
+    previous: dict[str, dict[str, int]] = dataclasses.field(
+        default_factory=dict,
+    )
+    hits: dict[str, dict[str, int]] = dataclasses.field(
+        default_factory=dict,
+    )
+
+    def add(self, name: str, stub_hits: Iterable[tuple[str, int]]) -> None:
+        target_hits = self.hits.setdefault(name, {})
+        for stub_id, hits in stub_hits:
+            if hits:
+                target_hits[stub_id] = target_hits.get(stub_id, 0) + hits
+
+    def dump(self) -> dict[str, dict[str, int]]:
+        """Serialize for sending from a pytest-xdist worker."""
+        return self.hits
+
+    def saved(self) -> dict[str, dict[str, int]]:
+        """Hits to save, of the previous session for the targets not used."""
+        return {**self.previous, **self.hits}
+
+    def merge(self, dumped: dict[str, dict[str, int]]) -> None:
+        """Merge the hits dumped by a pytest-xdist worker."""
+        for name, target_hits in dumped.items():
+            self.add(name, target_hits.items())
+
+
+registry_stats_key = pytest.StashKey[RegistryStats]()
+session_stats_key = pytest.StashKey[SessionStats]()
+stub_profile_key = pytest.StashKey[StubProfile]()
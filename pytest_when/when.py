@@ -2,32 +2,65 @@
 
 from __future__ import annotations
 
+import array
+import asyncio
 import enum
 import functools
+import hashlib
 import inspect
-
-from collections.abc import Callable, Hashable, Mapping
+import itertools
+import numbers
+import re
+import reprlib
+import threading
+import time
+import types
+import weakref
+
+from collections.abc import (
+    Awaitable,
+    Callable,
+    Container,
+    Generator,
+    Hashable,
+    Iterable,
+    Iterator,
+    Mapping,
+)
 from typing import TYPE_CHECKING, Any, Generic
 
 import pytest
 
-from friendly_sequences import Seq
-from pytest_mock.plugin import MockCacheItem
-
+from pytest_when import matchers
 from pytest_when.constant import (
+    Exhausted,
     _CallKey,
     _CallKeyParamDef,
     _CallLazyValue,
     _TargetCls,
     _TargetClsMethodKey,
-    _TargetClsName,
+    _TargetId,
     _TargetMethodArgs,
     _TargetMethodKwargs,
     _TargetMethodName,
     _TargetMethodParams,
     _TargetMethodReturn,
 )
-from pytest_when.interface import ThenResponse, WhenInitial, WhenResponse
+from pytest_when.interface import (
+    CalledTimes,
+    ThenResponse,
+    VerifyResponse,
+    WhenInitial,
+    WhenResponse,
+)
+from pytest_when.stats import (
+    StubProfile,
+    StubStats,
+    TargetStats,
+    registry_stats_key,
+    session_stats_key,
+    stub_profile_key,
+)
 
 
 if TYPE_CHECKING:
@@ -40,16 +73,49 @@ class Markers(enum.Enum):
     """Markers for defining When.called_with arguments.
 
     Markers.any - means the argument could be anything
+    Markers.same(obj) - obj itself, compared by identity
+    Markers.same_content(obj, digest) - an object of the same digest
+    Markers.instance_of(*types) - an instance of any of the types
+    Markers.between(low, high) - from low to high, both included
+    Markers.matches(pattern) - a string in which the regex is found
+    Markers.satisfies(predicate) - the predicate is true for the argument
     """
 
     any = "any"
 
+    same = staticmethod(matchers.same)
+    same_content = staticmethod(matchers.same_content)
+    instance_of = staticmethod(matchers.instance_of)
+    between = staticmethod(matchers.between)
+    matches = staticmethod(matchers.matches)
+    satisfies = staticmethod(matchers.satisfies)
+
+
+# values of these types are hashable as they are, so the dispatch of
+# make_hashable is skipped for them
+HASHABLE_SCALAR_TYPES = frozenset(
+    (bool, bytes, complex, float, int, str, type(None), Markers),
+)
+
+
+# values of these types can't contain Markers
+PLAIN_TYPES = HASHABLE_SCALAR_TYPES - {Markers}
+
 
 def make_container_hashable(
     container: tuple[tuple[str, Any], ...],
 ) -> tuple[tuple[str, Any], ...]:
     """Make call signature hashable recursively."""
-    return tuple((arg, make_hashable(value)) for arg, value in container)
+    if HASHABLE_SCALAR_TYPES.issuperset(type(value) for _, value in container):
+        return container
+    return tuple((arg, make_value_hashable(value)) for arg, value in container)
+
+
+def make_value_hashable(val: Any) -> Hashable:
+    """Make val hashable, skipping the dispatch for scalar values."""
+    if type(val) in HASHABLE_SCALAR_TYPES:
+        return val
+    return make_hashable(val)
 
 
 @functools.singledispatch
@@ -60,13 +126,17 @@ def make_hashable(val) -> Hashable:
 
 @make_hashable.register
 def _(val: Mapping) -> tuple[tuple[str, Any], ...]:
-    return tuple((k, make_hashable(v)) for k, v in val.items())
+    if HASHABLE_SCALAR_TYPES.issuperset(map(type, val.values())):
+        return tuple(val.items())
+    return tuple((k, make_value_hashable(v)) for k, v in val.items())
 
 
 @make_hashable.register(list)
 @make_hashable.register(set)
 def _(val: list[Any] | set[Any]) -> tuple[Any, ...]:
-    return tuple(map(make_hashable, val))
+    if HASHABLE_SCALAR_TYPES.issuperset(map(type, val)):
+        return tuple(val)
+    return tuple(map(make_value_hashable, val))
 
 
 def create_call_key(
@@ -82,101 +152,1275 @@ def create_call_key(
 
     Supports normal functions as well as class methods.
     """
-    call = original_callable_sig.bind(*args, **kwargs)
+    return get_call_key(original_callable_sig.bind(*args, **kwargs))
+
 
+def get_call_key(call: inspect.BoundArguments) -> _CallKey:
+    """Create the call key of the bound call."""
     return make_container_hashable(tuple(call.arguments.items()))
 
 
-def handle_variadic_args_kwargs(key: tuple[str, Any]) -> tuple[str, Any]:
-    if key[0] == "kwargs":
-        return key[1]
-    return (key,)  # type: ignore
+def get_var_keyword(original_callable_sig: inspect.Signature) -> str | None:
+    """Return the name of the **kwargs param of the signature if any."""
+    for param in original_callable_sig.parameters.values():
+        if param.kind is inspect.Parameter.VAR_KEYWORD:
+            return param.name
+    return None
 
 
-def get_mocked_call_result(
-    original_callable_sig: inspect.Signature,
-    mocked_calls: dict[
-        _CallKey,
-        _CallLazyValue,
-    ],
-    *args: _TargetMethodArgs,
-    **kwargs: _TargetMethodKwargs,
-) -> _TargetMethodReturn:  # type: ignore
-    call_key = create_call_key(
-        original_callable_sig,
-        *args,
-        **kwargs,
+def flatten_call_key(
+    call_key: _CallKey | Mapping[str, Any],
+    var_keyword: str | None,
+) -> _CallKeyParamDef:
+    """Map params of the call key to their values, unpacking **kwargs."""
+    call_params = dict(call_key)
+    if var_keyword in call_params:
+        # **kwargs is always the last param of the signature
+        call_params.update(call_params.pop(var_keyword))
+    return call_params
+
+
+def has_markers(value: Any) -> bool:
+    """Check if the value contains Markers at any level of nesting."""
+    if isinstance(value, tuple):
+        return any(map(has_markers, value))
+    return isinstance(value, (Markers, matchers.ArgumentMatcher))
+
+
+def values_matching(mocked_value: Any, value: Any) -> bool:
+    if mocked_value is Markers.any:
+        return True
+    if isinstance(mocked_value, matchers.ArgumentMatcher):
+        return value is not _MISSING and mocked_value.matches(value)
+    if isinstance(mocked_value, tuple):
+        return (
+            isinstance(value, tuple)
+            and len(mocked_value) == len(value)
+            and all(map(values_matching, mocked_value, value))
+        )
+    try:
+        return bool(mocked_value == value)
+    except (TypeError, ValueError):
+        # the equality is ambiguous, e.g. elementwise for arrays
+        return False
+
+
+_MISSING = object()
+
+
+class Answer:
+    """Lazy value computing the result from the call.
+
+    The answer gets the inspect.BoundArguments of the call, with the
+    defaults applied.
+    """
+
+    __slots__ = ("answer",)
+
+    def __init__(
+        self, answer: Callable[[inspect.BoundArguments], Any]
+    ) -> None:
+        self.answer = answer
+
+    def __call__(self, call: inspect.BoundArguments) -> Any:
+        call.apply_defaults()
+        return self.answer(call)
+
+
+_matcher_serials = itertools.count()
+
+
+class CallMatcher:
+    """called_with specification compiled for matching the calls.
+
+    The call key is split once on registration into:
+    - wildcards - params, which could be anything, only their presence
+      in the call is checked
+    - fixed - params with concrete values compared by equality
+    - arguments - params with argument matchers, ordered by their cost
+    - nested - containers with Markers inside, matched recursively
+    and the call params are checked in this order, stopping at the first
+    param which doesn't match.
+    """
+
+    __slots__ = (
+        "arguments",
+        "call_key",
+        "calls",
+        "calls_before",
+        "fixed",
+        "lazy_value",
+        "nested",
+        "params",
+        "position",
+        "serial",
+        "stats",
+        "wildcards",
     )
 
-    def params_are_compatible(
-        param_in_mocked_call: _CallKeyParamDef,
-        param_in_call: _CallKeyParamDef,
+    def __init__(
+        self,
+        call_key: _CallKey,
+        var_keyword: str | None,
+        position: int,
+        lazy_value: _CallLazyValue | Answer,
+        calls_before: int = 0,
+    ) -> None:
+        params = flatten_call_key(call_key, var_keyword)
+        self.call_key = call_key
+        self.position = position
+        # unique among the matchers of all the targets and layers
+        self.serial = next(_matcher_serials)
+        self.lazy_value = lazy_value
+        self.stats = StubStats()
+        # the calls matched, counted even if they fall through
+        self.calls = 0
+        # the calls of the target before the registration, not counted
+        self.calls_before = calls_before
+        self.params = tuple(params)
+        wildcards: list[str] = []
+        fixed: list[tuple[str, Any]] = []
+        arguments: list[tuple[str, matchers.ArgumentMatcher]] = []
+        nested: list[tuple[str, Any]] = []
+        # a single pass over the params, the plain values are the most common
+        for name, value in params.items():
+            if type(value) in PLAIN_TYPES:
+                fixed.append((name, value))
+            elif value is Markers.any:
+                wildcards.append(name)
+            elif isinstance(value, matchers.ArgumentMatcher):
+                arguments.append((name, value))
+            elif not has_markers(value):
+                fixed.append((name, value))
+            elif isinstance(value, tuple):
+                nested.append((name, value))
+        self.wildcards = tuple(wildcards)
+        self.fixed = tuple(fixed)
+        self.arguments = tuple(
+            sorted(arguments, key=lambda argument: argument[1].cost)
+        )
+        self.nested = tuple(nested)
+
+    @property
+    def is_exact(self) -> bool:
+        return not self.wildcards and not self.arguments and not self.nested
+
+    def respond(self, call: inspect.BoundArguments) -> Any:
+        """Return the result of the lazy value for the matched call."""
+        lazy_value = self.lazy_value
+        if isinstance(lazy_value, Answer):
+            return lazy_value(call)
+        return lazy_value()
+
+    def matches(
+        self,
+        call_params: _CallKeyParamDef,
+        call_arguments: _CallKeyParamDef,
     ) -> bool:
-        def values_matching(v1, v2) -> bool:
-            if isinstance(v1, tuple):
-                return Seq(v1).zip(v2).starmap(values_matching).all()
-            if v1 is Markers.any:
-                return True
-            return v1 == v2
+        """Check the call params against the called_with specification.
 
-        return (
-            Seq(param_in_call)
-            .map(
-                lambda key: values_matching(
-                    param_in_call[key],
-                    param_in_mocked_call[key],
-                )
+        The argument matchers get the call_arguments, the params of the
+        call as they were passed.
+        """
+        for name in self.wildcards:
+            if name not in call_params:
+                return False
+        try:
+            for name, value in self.fixed:
+                if call_params.get(name, _MISSING) != value:
+                    return False
+        except (TypeError, ValueError):
+            # the equality is ambiguous, e.g. elementwise for arrays
+            return False
+        if self.arguments and not self.arguments_match(call_arguments):
+            return False
+        for name, value in self.nested:
+            if not values_matching(value, call_params.get(name, _MISSING)):
+                return False
+        return True
+
+    def arguments_match(self, call_arguments: _CallKeyParamDef) -> bool:
+        for name, argument_matcher in self.arguments:
+            value = call_arguments.get(name, _MISSING)
+            if value is _MISSING or not argument_matcher.matches(value):
+                return False
+        return True
+
+
+class MatcherTable:
+    """Immutable snapshot of the mocked calls of a single target.
+
+    Call keys which have concrete values only are found by a hash lookup
+    of the call params projected on the call key params. Call keys with
+    Markers are kept in a fallback bucket, which is checked only for
+    the call keys registered before the found one, so the first
+    registered matching call key always wins.
+
+    Only the params compared by value, listed in compared, are made
+    hashable for the lookup, the others, e.g. matched by Markers.same,
+    are passed to the matchers as they are, however large they are.
+
+    The hot fallback matchers are checked first, in any order, they are
+    disjoint from all the fallback matchers registered before them, so
+    if one matches the call, none of those does. The others are checked
+    after them in the order of the registration.
+    """
+
+    __slots__ = ("compared", "exact", "fallback", "hot", "matchers", "ordered")
+
+    def __init__(
+        self,
+        matchers: dict[_CallKey, CallMatcher],
+        exact: dict[tuple[str, ...], dict[tuple[Any, ...], CallMatcher]],
+        fallback: tuple[CallMatcher, ...],
+        compared: frozenset[str],
+        hot: tuple[CallMatcher, ...] = (),
+    ) -> None:
+        self.matchers = matchers
+        self.exact = exact
+        self.fallback = fallback
+        self.compared = compared
+        self.hot = hot
+        if hot:
+            hot_matchers = set(hot)
+            self.ordered = tuple(
+                matcher for matcher in fallback if matcher not in hot_matchers
             )
-            .all()
+        else:
+            self.ordered = fallback
+
+    def get_call_params(
+        self,
+        call_arguments: _CallKeyParamDef,
+    ) -> _CallKeyParamDef:
+        """Make the params compared by value hashable for the lookup."""
+        compared = self.compared
+        return {
+            name: make_value_hashable(value) if name in compared else value
+            for name, value in call_arguments.items()
+        }
+
+    def find(self, call_arguments: _CallKeyParamDef) -> CallMatcher | None:
+        """Find the first registered matcher matching the call arguments."""
+        call_params = self.get_call_params(call_arguments)
+        try:
+            found = self.find_exact(call_params)
+        except TypeError:
+            # unhashable param values, only a full scan is possible
+            return self.scan(call_params, call_arguments, ())
+        found_position = (
+            len(self.matchers) if found is None else found.position
+        )
+        for matcher in self.hot:
+            if matcher.position < found_position and matcher.matches(
+                call_params,
+                call_arguments,
+            ):
+                return matcher
+        for matcher in self.ordered:
+            if matcher.position > found_position:
+                break
+            if matcher.matches(call_params, call_arguments):
+                return matcher
+        return found
+
+    def find_next(
+        self,
+        call_arguments: _CallKeyParamDef,
+        passed: Container[CallMatcher],
+    ) -> CallMatcher | None:
+        """Find the first matcher matching the call arguments, but the passed.
+
+        The passed matchers let the call fall through, all the others are
+        checked in the order of their registration.
+        """
+        return self.scan(
+            self.get_call_params(call_arguments),
+            call_arguments,
+            passed,
         )
 
-    def call_matched_call_key(mocked_call_key: _CallKey) -> bool:
-        return params_are_compatible(
+    def scan(
+        self,
+        call_params: _CallKeyParamDef,
+        call_arguments: _CallKeyParamDef,
+        passed: Container[CallMatcher],
+    ) -> CallMatcher | None:
+        """Check all the matchers but the passed ones, in their order."""
+        return next(
             (
-                Seq(
+                matcher
+                for matcher in self.matchers.values()
+                if matcher not in passed
+                and matcher.matches(call_params, call_arguments)
+            ),
+            None,
+        )
+
+    def find_exact(self, call_params: _CallKeyParamDef) -> CallMatcher | None:
+        found: CallMatcher | None = None
+        for params, exact_matchers in self.exact.items():
+            if not all(map(call_params.__contains__, params)):
+                continue
+            matcher = exact_matchers.get(
+                tuple(call_params[param] for param in params)
+            )
+            if matcher is not None and (
+                found is None or matcher.position < found.position
+            ):
+                found = matcher
+        return found
+
+
+EMPTY_MATCHER_TABLE = MatcherTable({}, {}, (), frozenset())
+
+# the calls after which the hot matchers are reordered first, the
+# interval doubles up to the max one
+FIRST_REORDER = 16
+MAX_REORDER_INTERVAL = 4096
+
+
+# the addresses in the default reprs differ between the sessions
+_address_pattern = re.compile(r" at 0x[0-9a-fA-F]+")
+
+
+def get_stub_id(matcher: CallMatcher) -> str:
+    """Identify the mocked call between the sessions by its params.
+
+    The values are described by their bounded repr, without addresses,
+    and the argument matchers, e.g. Markers.same of a large object, only
+    by their type.
+    """
+    described = repr(
+        [
+            *(
+                (name, _described_value_repr.repr(value))
+                for name, value in (*matcher.fixed, *matcher.nested)
+            ),
+            *((name, "any") for name in matcher.wildcards),
+            *(
+                (name, type(argument_matcher).__name__)
+                for name, argument_matcher in matcher.arguments
+            ),
+        ]
+    )
+    return hashlib.blake2b(
+        _address_pattern.sub("", described).encode(),
+        digest_size=8,
+    ).hexdigest()
+
+
+def are_disjoint(matcher: CallMatcher, other: CallMatcher) -> bool:
+    """Check no call matches both, i.e. a param is fixed to other values."""
+    fixed = dict(matcher.fixed)
+    try:
+        return any(
+            name in fixed and fixed[name] != value
+            for name, value in other.fixed
+        )
+    except (TypeError, ValueError):
+        # the equality is ambiguous, e.g. elementwise for arrays
+        return False
+
+
+class MockedCallsIndex:
+    """Mocked calls of a single target indexed for a fast lookup.
+
+    The calls are matched against the published MatcherTable without
+    locking. Writers are serialized by the lock and only add the mocked
+    calls to the registered ones, the first call after them builds a new
+    table from the registered mocked calls under the lock and publishes
+    it by a single attribute assignment. So registering many mocked
+    calls one by one doesn't copy the table every time, and concurrent
+    callers of the target always see a consistent table, with or
+    without the GIL.
+
+    The mocked calls of a target patched in an outer scope are added as
+    a layer, which takes precedence over this index until it is removed.
+
+    If the profile, the hits of the mocked calls by their stub ids from
+    the previous session, is given, the fallback matchers disjoint from
+    all the fallback matchers registered before them are checked first,
+    the most hit first, and they are reordered as the calls come.
+    """
+
+    def __init__(
+        self,
+        original_callable_sig: inspect.Signature,
+        name: str = "",
+        *,
+        strict: bool | None = None,
+        default_strict: bool = False,
+        profile: dict[str, int] | None = None,
+    ) -> None:
+        self.var_keyword = get_var_keyword(original_callable_sig)
+        self.strict = strict
+        self.default_strict = default_strict
+        self.stats = TargetStats(name)
+        # the stats counting the calls of the target, of the bottom layer
+        self.target_stats = self.stats
+        self.lock = threading.Lock()
+        self.published: MatcherTable | None = EMPTY_MATCHER_TABLE
+        # the registered mocked calls, owned by the writers
+        self.registered: dict[_CallKey, CallMatcher] = {}
+        self.registered_exact: dict[
+            tuple[str, ...],
+            dict[tuple[Any, ...], CallMatcher],
+        ] = {}
+        self.registered_fallback: list[CallMatcher] = []
+        self.registered_compared: set[str] = set()
+        self.layer: MockedCallsIndex | None = None
+        self.call_log: CallLog | None = None
+        self.profile = profile
+        self.stub_ids: dict[CallMatcher, str] = {}
+        self.disjoint: set[CallMatcher] = set()
+        self.observed = 0
+        self.next_reorder = FIRST_REORDER
+
+    @property
+    def table(self) -> MatcherTable:
+        """The published table, built if mocked calls were registered."""
+        table = self.published
+        if table is None:
+            with self.lock:
+                table = self.published
+                if table is None:
+                    table = self.published = self.build_table()
+        return table
+
+    def build_table(self) -> MatcherTable:
+        fallback = tuple(self.registered_fallback)
+        return MatcherTable(
+            dict(self.registered),
+            {
+                params: dict(exact_matchers)
+                for params, exact_matchers in self.registered_exact.items()
+            },
+            fallback,
+            frozenset(self.registered_compared),
+            self.order_hot(fallback),
+        )
+
+    @property
+    def matchers(self) -> dict[_CallKey, CallMatcher]:
+        return self.table.matchers
+
+    @property
+    def exact(
+        self,
+    ) -> dict[tuple[str, ...], dict[tuple[Any, ...], CallMatcher]]:
+        return self.table.exact
+
+    @property
+    def fallback(self) -> tuple[CallMatcher, ...]:
+        return self.table.fallback
+
+    def __setitem__(
+        self,
+        call_key: _CallKey,
+        value: _CallLazyValue | Answer,
+    ) -> None:
+        self.update(((call_key, value),))
+
+    def update(
+        self,
+        mocked_calls: Iterable[tuple[_CallKey, _CallLazyValue | Answer]],
+        *,
+        calls_before: int = 0,
+    ) -> None:
+        """Register the mocked calls, published at once by the next call.
+
+        A call key registered again keeps its position and gets the new
+        lazy value. If the mocked_calls iterable raises, nothing is
+        registered. calls_before is the number of the calls of the
+        target before the registration.
+        """
+        with self.lock:
+            registered = self.registered
+            added: dict[_CallKey, CallMatcher] = {}
+            replaced: list[tuple[CallMatcher, _CallLazyValue | Answer]] = []
+            for call_key, value in mocked_calls:
+                matcher = added.get(call_key)
+                if matcher is None:
+                    matcher = registered.get(call_key)
+                if matcher is not None:
+                    replaced.append((matcher, value))
+                    continue
+                added[call_key] = CallMatcher(
                     call_key,
+                    self.var_keyword,
+                    len(registered) + len(added),
+                    value,
+                    calls_before,
                 )
-                .map(handle_variadic_args_kwargs)
-                .flatten()
-                .to_dict()
-            ),
+            for matcher, value in replaced:
+                matcher.lazy_value = value
+            for call_key, matcher in added.items():
+                self.register(call_key, matcher)
+            if added:
+                self.published = None
+
+    def register(self, call_key: _CallKey, matcher: CallMatcher) -> None:
+        """Add the matcher to the registered ones, holding the lock."""
+        self.registered[call_key] = matcher
+        self.stats.stubs[call_key] = matcher.stats
+        matcher.stats.count_misses(self.target_stats)
+        self.registered_compared.update(name for name, _ in matcher.fixed)
+        self.registered_compared.update(name for name, _ in matcher.nested)
+        if self.profile is not None:
+            self.stub_ids[matcher] = get_stub_id(matcher)
+        if matcher.is_exact:
+            self.registered_exact.setdefault(matcher.params, {})[
+                tuple(value for _, value in matcher.fixed)
+            ] = matcher
+            return
+        if self.profile is not None and all(
+            are_disjoint(matcher, other) for other in self.registered_fallback
+        ):
+            self.disjoint.add(matcher)
+        self.registered_fallback.append(matcher)
+
+    def order_hot(
+        self,
+        fallback: Iterable[CallMatcher],
+    ) -> tuple[CallMatcher, ...]:
+        """Order the disjoint fallback matchers by their hits, most first.
+
+        The hits are the calls matched in this session and the hits of
+        the mocked call with the same stub id in the previous session.
+        """
+        profile = self.profile
+        if profile is None:
+            return ()
+        stub_ids = self.stub_ids
+        return tuple(
+            sorted(
+                (matcher for matcher in fallback if matcher in self.disjoint),
+                key=lambda matcher: -(
+                    matcher.calls + profile.get(stub_ids[matcher], 0)
+                ),
+            )
+        )
+
+    def reorder(self) -> None:
+        """Publish the table with the hot matchers ordered by their hits.
+
+        Skipped if a writer holds the lock, it publishes an ordered
+        table anyway.
+        """
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            table = self.published
+            if table is None:
+                # the table built by the next call is ordered anyway
+                return
+            self.published = MatcherTable(
+                table.matchers,
+                table.exact,
+                table.fallback,
+                table.compared,
+                self.order_hot(table.fallback),
+            )
+        finally:
+            self.lock.release()
+
+    def clear(self) -> None:
+        with self.lock:
+            self.published = EMPTY_MATCHER_TABLE
+            self.registered = {}
+            self.registered_exact = {}
+            self.registered_fallback = []
+            self.registered_compared = set()
+            self.stats.stubs.clear()
+            self.stub_ids.clear()
+            self.disjoint.clear()
+
+    def is_strict(self) -> bool:
+        """Whether the not matched calls fail, called on the bottom layer.
+
+        The highest layer setting strict decides, the layers which don't
+        set it inherit the mode of the layers below, and the bottom one
+        falls back to its default_strict.
+        """
+        strict = self.strict
+        layer = self.layer
+        while layer is not None:
+            if layer.strict is not None:
+                strict = layer.strict
+            layer = layer.layer
+        return self.default_strict if strict is None else strict
+
+    def layers(self) -> list[MockedCallsIndex]:
+        """Return the layers from the top one, in the order of the lookup."""
+        layers = []
+        index: MockedCallsIndex | None = self
+        while index is not None:
+            layers.append(index)
+            index = index.layer
+        return layers[::-1]
+
+    def find(self, call: inspect.BoundArguments) -> CallMatcher | None:
+        """Find the first registered matcher matching the bound call.
+
+        The matchers of the layer are checked first.
+        """
+        layer = self.layer
+        if layer is not None:
+            found = layer.find(call)
+            if found is not None:
+                return found
+        return self.table.find(
+            flatten_call_key(call.arguments, self.var_keyword)
+        )
+
+    def find_next(
+        self,
+        call: inspect.BoundArguments,
+        passed: Container[CallMatcher],
+    ) -> CallMatcher | None:
+        """Find the first matcher matching the bound call but the passed ones.
+
+        The slow path of the calls which the found matchers let fall
+        through: all the matchers are checked, the ones of the layer first.
+        """
+        layer = self.layer
+        if layer is not None:
+            found = layer.find_next(call, passed)
+            if found is not None:
+                return found
+        return self.table.find_next(
+            flatten_call_key(call.arguments, self.var_keyword),
+            passed,
+        )
+
+    def match_next(
+        self,
+        call: inspect.BoundArguments,
+        passed: Container[CallMatcher],
+    ) -> CallMatcher | None:
+        """Find the next matcher of the bound call, counting the call."""
+        matcher = self.find_next(call, passed)
+        if matcher is not None:
+            matcher.calls += 1
+        return matcher
+
+    def match(self, call: inspect.BoundArguments) -> CallMatcher | None:
+        """Find the matcher of the bound call, counting and logging the call."""
+        matcher = self.find(call)
+        if matcher is not None:
+            matcher.calls += 1
+        if self.profile is not None:
+            self.observed += 1
+            if self.observed >= self.next_reorder:
+                self.next_reorder += min(self.observed, MAX_REORDER_INTERVAL)
+                index: MockedCallsIndex | None = self
+                while index is not None:
+                    index.reorder()
+                    index = index.layer
+        call_log = self.call_log
+        if call_log is not None:
+            call_log.record(call, matcher)
+        return matcher
+
+
+def get_args_prefix(
+    original_callable_sig: inspect.Signature,
+) -> _TargetMethodArgs:
+    """Return Markers.any for the self arg in case of a method."""
+    params = tuple(original_callable_sig.parameters)
+    is_instance_method = False if not params else params[0] == "self"
+    return (Markers.any,) if is_instance_method else ()
+
+
+MIN_INT64 = -(2**63)
+MAX_INT64 = 2**63 - 1
+
+FINGERPRINT_KEY = b"pytest-when"
+
+
+def get_exact_int(value: Any) -> int | None:
+    """Return the int equal to the integral number, None otherwise."""
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    if isinstance(value, numbers.Real) and float(value).is_integer():
+        return int(float(value))
+    return None
+
+
+@functools.singledispatch
+def encode_hashable(value: Any) -> bytes:
+    """Encode the hashable form of value, the equal values alike.
+
+    The numbers, strings, bytes and tuples of them are encoded exactly,
+    the other values by their hash, so they are equal if their hashes
+    are. Raises TypeError if value isn't hashable.
+    """
+    return b"h%d;" % hash(value)
+
+
+@encode_hashable.register
+def _(value: numbers.Real) -> bytes:
+    exact_int = get_exact_int(value)
+    if exact_int is not None:
+        return b"i%d;" % exact_int
+    return b"f" + repr(float(value)).encode() + b";"
+
+
+@encode_hashable.register
+def _(value: str) -> bytes:
+    encoded = value.encode("utf-8", "surrogatepass")
+    return b"s%d:" % len(encoded) + encoded
+
+
+@encode_hashable.register
+def _(value: bytes) -> bytes:
+    return b"b%d:" % len(value) + value
+
+
+@encode_hashable.register
+def _(value: tuple) -> bytes:
+    return b"t%d:" % len(value) + b"".join(
+        encode_hashable(make_value_hashable(item)) for item in value
+    )
+
+
+def fingerprint(value: Any) -> int:
+    """Fingerprint the hashable form of value, the equal values alike.
+
+    The ints fitting 64 bits are kept as they are, the other values are
+    digested by a keyed 64 bits blake2b, the unhashable ones by their
+    identity.
+    """
+    if type(value) is int and MIN_INT64 <= value <= MAX_INT64:
+        return value
+    hashable = make_value_hashable(value)
+    exact_int = get_exact_int(hashable)
+    if exact_int is not None and MIN_INT64 <= exact_int <= MAX_INT64:
+        return exact_int
+    try:
+        encoded = encode_hashable(hashable)
+    except TypeError:
+        encoded = b"o%d;" % id(value)
+    return digest_fingerprint(encoded)
+
+
+def digest_fingerprint(encoded: bytes) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(encoded, digest_size=8, key=FINGERPRINT_KEY).digest(),
+        "big",
+        signed=True,
+    )
+
+
+# the fingerprint of the **kwargs keys not passed in the call, no value
+# is encoded as "m"
+MISSING_FINGERPRINT = digest_fingerprint(b"m")
+
+
+class UnrecordedCalls(list):
+    """Calls list of the mock which doesn't keep the calls.
+
+    It replaces the call lists of the mocks of the targets with a
+    CallLog, the mock still counts the calls and keeps the last one.
+    """
+
+    def append(self, _: Any) -> None:
+        """Drop the call."""
+
+
+def unrecord_calls(mock: MagicMock) -> None:
+    """Make the mock drop its calls, logged by a CallLog instead."""
+    mock.call_args_list = UnrecordedCalls()  # type: ignore[assignment]
+    mock.mock_calls = UnrecordedCalls()  # type: ignore[assignment]
+    if hasattr(mock, "await_args_list"):
+        mock.await_args_list = UnrecordedCalls()
+
+
+class CallLog:
+    """Compact log of the last calls of a patched target.
+
+    Instead of the call objects kept by the mock, every call is stored
+    in array columns: the serial of the mocked call matching it, -1 if
+    none, and a fingerprint of every param of the signature, the defaults
+    applied. The keys of **kwargs get their own columns, added as they
+    are passed, like the params. So the arguments aren't kept alive, and
+    once capacity calls are logged the oldest ones are overwritten.
+
+    The mocked call is the first one matching the call, even if its lazy
+    value lets the call fall through to the next one or to the original
+    callable.
+    """
+
+    def __init__(
+        self,
+        original_callable_sig: inspect.Signature,
+        capacity: int,
+        mocked_calls: MockedCallsIndex,
+    ) -> None:
+        self.signature = original_callable_sig
+        self.capacity = capacity
+        self.mocked_calls = mocked_calls
+        self.var_keyword = get_var_keyword(original_callable_sig)
+        self.defaults: dict[str, Any] = {
+            name: (
+                ()
+                if param.kind is inspect.Parameter.VAR_POSITIONAL
+                else param.default
+            )
+            for name, param in original_callable_sig.parameters.items()
+            if name != self.var_keyword
+        }
+        self.stubs = array.array("q", [0]) * capacity
+        self.fingerprints = tuple(
+            array.array("q", [0]) * capacity for _ in self.defaults
+        )
+        self.keyword_fingerprints: dict[str, array.array[int]] = {}
+        self.logged = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return min(self.logged, self.capacity)
+
+    def clear(self) -> None:
+        """Forget the logged calls."""
+        with self.lock:
+            self.logged = 0
+            self.keyword_fingerprints.clear()
+
+    @property
+    def dropped(self) -> int:
+        """Number of the calls overwritten by the newer ones."""
+        return self.logged - len(self)
+
+    @property
+    def misses(self) -> int:
+        """Number of the logged calls not matching any mocked call."""
+        with self.lock:
+            return self.stubs[: len(self)].count(-1)
+
+    def record(
+        self,
+        call: inspect.BoundArguments,
+        matcher: CallMatcher | None,
+    ) -> None:
+        arguments = call.arguments
+        fingerprints = [
+            fingerprint(arguments.get(name, default))
+            for name, default in self.defaults.items()
+        ]
+        keyword_fingerprints = [
+            (key, fingerprint(value))
+            for key, value in self.get_keywords(arguments).items()
+        ]
+        with self.lock:
+            index = self.logged % self.capacity
+            self.stubs[index] = -1 if matcher is None else matcher.serial
+            for column, value in zip(
+                self.fingerprints,
+                fingerprints,
+                strict=True,
+            ):
+                column[index] = value
+            for column in self.keyword_fingerprints.values():
+                column[index] = MISSING_FINGERPRINT
+            for key, value in keyword_fingerprints:
+                keyword_column = self.keyword_fingerprints.get(key)
+                if keyword_column is None:
+                    keyword_column = self.keyword_fingerprints[key] = (
+                        array.array("q", [MISSING_FINGERPRINT]) * self.capacity
+                    )
+                keyword_column[index] = value
+            self.logged += 1
+
+    def get_keywords(self, arguments: Mapping[str, Any]) -> dict[str, Any]:
+        """Return the **kwargs of the arguments, pairs in a call key."""
+        if self.var_keyword is None:
+            return {}
+        return dict(arguments.get(self.var_keyword, ()))
+
+    def count(self, *args: Any, **kwargs: Any) -> int:
+        """Count the logged calls with the args and kwargs.
+
+        The args and kwargs are given like to When.called_with, the params
+        which are Markers.any are not checked. The unhashable arguments
+        are compared by identity.
+        """
+        return self.count_arguments(
+            self.signature.bind(
+                *get_args_prefix(self.signature),
+                *args,
+                **kwargs,
+            ).arguments
+        )
+
+    def count_arguments(self, arguments: Mapping[str, Any]) -> int:
+        """Count the logged calls with the arguments of the params.
+
+        The keys of **kwargs not in the arguments aren't checked, the
+        ones which are Markers.any are only checked to be passed.
+        """
+        expected = [
+            (column, fingerprint(arguments.get(name, default)))
+            for column, (name, default) in zip(
+                self.fingerprints,
+                self.defaults.items(),
+                strict=True,
+            )
+            if arguments.get(name) is not Markers.any
+        ]
+        passed = []
+        with self.lock:
+            for key, value in self.get_keywords(arguments).items():
+                column = self.keyword_fingerprints.get(key)
+                if column is None:
+                    return 0
+                if value is Markers.any:
+                    passed.append(column)
+                else:
+                    expected.append((column, fingerprint(value)))
+            indexes: Iterable[int] = range(len(self))
+            for column, value in expected:
+                indexes = [
+                    index for index in indexes if column[index] == value
+                ]
+            for column in passed:
+                indexes = [
+                    index
+                    for index in indexes
+                    if column[index] != MISSING_FINGERPRINT
+                ]
+            return len(list(indexes))
+
+    def count_matched_by(self, *args: Any, **kwargs: Any) -> int:
+        """Count the logged calls matched by called_with(*args, **kwargs).
+
+        Only the mocked calls registered at the moment are looked up,
+        including the ones of the layers.
+        """
+        call_key = create_call_key(
+            self.signature,
+            *get_args_prefix(self.signature),
+            *args,
+            **kwargs,
+        )
+        serials = set()
+        mocked_calls: MockedCallsIndex | None = self.mocked_calls
+        while mocked_calls is not None:
+            matcher = mocked_calls.matchers.get(call_key)
+            if matcher is not None:
+                serials.add(matcher.serial)
+            mocked_calls = mocked_calls.layer
+        with self.lock:
+            return sum(serial in serials for serial in self.stubs[: len(self)])
+
+
+class NotMatched(enum.Enum):
+    """Sentinel returned when the call doesn't match any mocked call."""
+
+    not_matched = "not_matched"
+
+
+NOT_MATCHED = NotMatched.not_matched
+
+MAX_DESCRIBED_MOCKED_CALLS = 10
+
+_described_value_repr = reprlib.Repr()
+_described_value_repr.maxlevel = 3
+_described_value_repr.maxstring = 80
+_described_value_repr.maxother = 80
+
+
+class UnmatchedCallError(AssertionError):
+    """The call doesn't match any of the mocked calls.
+
+    It fails the test, as the other assertions, and isn't caught by the
+    code under test handling its own lookup errors, e.g. KeyError.
+
+    The message is built only when the exception is formatted and is
+    bounded both in the number of described mocked calls and in the
+    size of the described values.
+    """
+
+    def __init__(
+        self,
+        call_key: _CallKey,
+        mocked_calls: MockedCallsIndex,
+    ) -> None:
+        super().__init__(call_key)
+        self.call_key = call_key
+        self.mocked_calls = mocked_calls
+
+    def __str__(self) -> str:
+        matchers = [
+            matcher
+            for layer in self.mocked_calls.layers()
+            for matcher in layer.matchers.values()
+        ]
+        name = self.mocked_calls.stats.name
+        lines = [
             (
-                Seq(
-                    mocked_call_key,
-                )
-                .map(handle_variadic_args_kwargs)
-                .flatten()
-                .to_dict()
+                f"Call {_described_value_repr.repr(self.call_key)}"
+                + (f" of {name}" if name else "")
+                + f" doesn't match any of {len(matchers)} mocked calls:"
             ),
-        )
+            *(
+                f"  {_described_value_repr.repr(matcher.call_key)}"
+                for matcher in matchers[:MAX_DESCRIBED_MOCKED_CALLS]
+            ),
+        ]
+        if len(matchers) > MAX_DESCRIBED_MOCKED_CALLS:
+            lines.append(
+                f"  ... and {len(matchers) - MAX_DESCRIBED_MOCKED_CALLS} more"
+            )
+        return "\n".join(lines)
 
-    for call in filter(call_matched_call_key, mocked_calls):
+
+def get_mocked_call_result(
+    original_callable_sig: inspect.Signature,
+    mocked_calls: MockedCallsIndex,
+    *args: _TargetMethodArgs,
+    **kwargs: _TargetMethodKwargs,
+) -> _TargetMethodReturn | NotMatched:
+    """Return the result of the first mocked call matching the call.
+
+    If the lazy value of the mocked call returns NOT_MATCHED, the next
+    matching mocked call responds. NOT_MATCHED is returned if there is
+    no such mocked call left, nothing describing the call is built on
+    this path.
+    """
+    call = original_callable_sig.bind(*args, **kwargs)
+    matcher = mocked_calls.match(call)
+    passed: list[CallMatcher] = []
+    while matcher is not None:
         # unwrapping the result of the lazy value
-        return mocked_calls[call]()
-    raise KeyError(f"Call {call_key} is not in mocked_calls {mocked_calls}")
+        result = matcher.respond(call)
+        if result is not NOT_MATCHED:
+            return result
+        passed.append(matcher)
+        matcher = mocked_calls.match_next(call, passed)
+    return NOT_MATCHED
+
+
+def no_clock() -> float:
+    """Clock of the side effects which are not instrumented."""
+    return 0.0
+
+
+def intercept(
+    origin_callable: Callable[..., Any],
+    origin_callable_sig: inspect.Signature,
+    mocked_calls: MockedCallsIndex,
+    args: tuple[Any, ...],
+    kwargs: dict[str, Any],
+    *,
+    clock: Callable[[], float],
+) -> Generator[Any, Any, Any]:
+    """Decide the result of a call of the patched target.
+
+    The match, the response of the mocked call and the miss are decided
+    here for the side effects of both the functions and the coroutine
+    functions: the results of the lazy value and of the origin_callable
+    are yielded to the side effect, which sends them back, awaited if it
+    is a coroutine function. The result of the call is returned.
+    """
+    stats = mocked_calls.stats
+    started = clock()
+    call = origin_callable_sig.bind(*args, **kwargs)
+    matcher = mocked_calls.match(call)
+    stats.calls += 1
+    passed: list[CallMatcher] = []
+    while True:
+        matched = clock()
+        stats.matching_time += matched - started
+        if matcher is None:
+            break
+        matcher.stats.matches += 1
+        matcher.stats.matching_time += matched - started
+        try:
+            result = yield matcher.respond(call)
+        finally:
+            elapsed = clock() - matched
+            matcher.stats.time += elapsed
+            stats.stubs_time += elapsed
+        if result is not NOT_MATCHED:
+            return result
+        # the mocked call let the call fall through to the next one
+        matcher.stats.matches -= 1
+        matcher.stats.fallthroughs += 1
+        passed.append(matcher)
+        started = clock()
+        matcher = mocked_calls.match_next(call, passed)
+    stats.misses += 1
+    if mocked_calls.is_strict():
+        raise UnmatchedCallError(get_call_key(call), mocked_calls)
+    stats.fallthroughs += 1
+    original_started = clock()
+    try:
+        return (yield origin_callable(*args, **kwargs))
+    finally:
+        stats.original_time += clock() - original_started
 
 
 def side_effect_factory(
     origin_callable: Callable[_TargetMethodParams, _TargetMethodReturn],
-    mocked_calls: dict[_CallKey, _CallLazyValue],
+    origin_callable_sig: inspect.Signature,
+    mocked_calls: MockedCallsIndex,
+    *,
+    instrument: bool = False,
 ) -> Callable[_TargetMethodParams, _TargetMethodReturn]:
+    """Build the side effect of the patched target, see intercept.
+
+    If the lazy value of the mocked call returns NOT_MATCHED, the call is
+    matched against the next mocked calls. Not matched calls are passed
+    to the origin_callable, or, if mocked_calls is strict, fail with
+    UnmatchedCallError describing the mocked calls of all the layers.
+    The calls are counted in mocked_calls.stats, and timed if instrument
+    is set.
+    """
+    if inspect.iscoroutinefunction(origin_callable):
+        return async_side_effect_factory(  # type: ignore[return-value]
+            origin_callable,
+            origin_callable_sig,
+            mocked_calls,
+            instrument=instrument,
+        )
+    clock = time.perf_counter if instrument else no_clock
+
     def side_effect(
         *args: _TargetMethodParams.args,
         **kwargs: _TargetMethodParams.kwargs,
     ) -> _TargetMethodReturn:
+        steps = intercept(
+            origin_callable,
+            origin_callable_sig,
+            mocked_calls,
+            args,
+            kwargs,
+            clock=clock,
+        )
         try:
-            return get_mocked_call_result(
-                inspect.signature(origin_callable),
-                mocked_calls,
-                *args,
-                **kwargs,
-            )
-        except KeyError:
-            return origin_callable(*args, **kwargs)
+            result = next(steps)
+            while True:
+                result = steps.send(result)
+        except StopIteration as stop:
+            return stop.value
 
     return side_effect
 
 
+async def await_step(steps: Generator[Any, Any, Any], result: Any) -> Any:
+    """Await the result yielded by intercept, closing it if that fails."""
+    if not inspect.isawaitable(result):
+        return result
+    try:
+        return await result
+    except BaseException:
+        # intercept times the call as it is closed
+        steps.close()
+        raise
+
+
+def async_side_effect_factory(
+    origin_callable: Callable[
+        _TargetMethodParams,
+        Awaitable[_TargetMethodReturn],
+    ],
+    origin_callable_sig: inspect.Signature,
+    mocked_calls: MockedCallsIndex,
+    *,
+    instrument: bool = False,
+) -> Callable[_TargetMethodParams, Awaitable[_TargetMethodReturn]]:
+    """Build the side effect of the patched coroutine function.
+
+    The same as side_effect_factory, but the side effect is a coroutine
+    function, so the mock awaits it. The awaitable results of the lazy
+    values and the not matched calls to the origin_callable are awaited.
+    """
+    clock = time.perf_counter if instrument else no_clock
+
+    async def async_side_effect(
+        *args: _TargetMethodParams.args,
+        **kwargs: _TargetMethodParams.kwargs,
+    ) -> _TargetMethodReturn:
+        steps = intercept(
+            origin_callable,
+            origin_callable_sig,
+            mocked_calls,
+            args,
+            kwargs,
+            clock=clock,
+        )
+        try:
+            result = next(steps)
+            while True:
+                result = steps.send(await await_step(steps, result))
+        except StopIteration as stop:
+            return stop.value
+
+    return async_side_effect
+
+
+def lazy_return(value: Any) -> _CallLazyValue:
+    """Build the lazy value of a mocked call returning value."""
+    return lambda: value
+
+
+class ResponsesExhaustedError(LookupError):
+    """All the responses of the mocked call were returned."""
+
+
+def lazy_return_many(
+    values: Iterable[Any],
+    on_exhausted: Exhausted,
+) -> _CallLazyValue:
+    """Build the lazy value returning the next of values on every call.
+
+    The values are consumed lazily, one per call, and only the last one
+    is kept.
+    """
+    iterator = iter(values)
+    lock = threading.Lock()
+    last: Any = _MISSING
+    exhausted = False
+
+    def next_value() -> Any:
+        nonlocal last, exhausted
+        with lock:
+            if not exhausted:
+                value = next(iterator, _MISSING)
+                if value is not _MISSING:
+                    last = value
+                    return value
+                exhausted = True
+        if on_exhausted is Exhausted.fall_through:
+            return NOT_MATCHED
+        if on_exhausted is Exhausted.repeat_last and last is not _MISSING:
+            return last
+        raise ResponsesExhaustedError(
+            "All the responses of the mocked call were returned"
+        )
+
+    return next_value
+
+
+def get_target_name(cls: Any, method: _TargetMethodName) -> str:
+    """Name the target in the reports, i.e. module.Klass.method."""
+    if isinstance(cls, types.ModuleType):
+        return f"{cls.__name__}.{method}"
+    if not isinstance(cls, type):
+        return f"{get_target_name(type(cls), method)} (instance)"
+    return f"{cls.__module__}.{cls.__qualname__}.{method}"
+
+
+def untrack_patch(mocker: MockerFixture, patch: Any) -> None:
+    """Remove the patch from the ones stopped by the mocker, if still there."""
+    mock_cache = mocker._mock_cache
+    mock_cache.cache = [
+        item for item in mock_cache.cache if item.patch is not patch
+    ]
+
+
 class MockedCalls(
     Generic[
         _TargetCls,
@@ -184,13 +1428,252 @@ class MockedCalls(
         _TargetMethodReturn,
     ]
 ):
-    mocked_calls_registry: dict[
-        _TargetClsMethodKey,
-        dict[_CallKey, _CallLazyValue],
-    ] = {}  # noqa: RUF012
-
-    def __init__(self, mocker: MockerFixture) -> None:
+    def __init__(
+        self,
+        mocker: MockerFixture,
+        *,
+        instrument: bool = False,
+        strict: bool | None = None,
+        default_strict: bool = False,
+        call_log: int = 0,
+        profile: StubProfile | None = None,
+        parent: MockedCalls | None = None,
+    ) -> None:
+        """Registry of the mocked calls and the patches of the targets.
+
+        The targets already patched by the parent, the MockedCalls of an
+        outer scope, are not patched again: their mocked calls are added
+        as a layer of the parent's mocked calls, removed by clear. The
+        targets already patched by a child, the MockedCalls of an inner
+        scope, are taken over: the child's mocked calls become a layer of
+        these and the patch is stopped by this clear.
+
+        strict sets the mode of the targets, if None, the targets patched
+        here are strict if default_strict is set, and the layers on the
+        targets of an outer scope inherit its mode.
+
+        If call_log is set, the mocks of the patched targets don't keep
+        their calls, the last call_log calls are logged in a CallLog
+        instead.
+
+        If profile is given, the mocked calls of the targets are ordered
+        by their hits, see MockedCallsIndex.
+        """
         self.mocker = mocker
+        self.instrument = instrument
+        self.strict = strict
+        self.default_strict = default_strict
+        self.call_log = call_log
+        self.profile = profile
+        self.parent: MockedCalls | None = None
+        self.children: list[MockedCalls] = []
+        if parent is not None:
+            parent.adopt(self)
+            self.reset_outer_history()
+        self.mocked_calls_registry: dict[
+            _TargetClsMethodKey,
+            MockedCallsIndex,
+        ] = {}
+        self.signatures: dict[
+            _TargetClsMethodKey,
+            tuple[Callable, inspect.Signature],
+        ] = {}
+        self.targets: dict[_TargetId, weakref.ref | _TargetCls] = {}
+        self.mocks: dict[_TargetClsMethodKey, MagicMock] = {}
+        self.patches: dict[_TargetClsMethodKey, Any] = {}
+        # the mocked calls of the parent below the layers of this registry
+        self.layered: dict[_TargetClsMethodKey, MockedCallsIndex] = {}
+
+    def get_target_key(
+        self,
+        cls: _TargetCls,
+        method: _TargetMethodName,
+    ) -> _TargetClsMethodKey:
+        """Return the registry key of cls.method based on the cls identity.
+
+        The cls is referenced weakly, so its entries are removed as soon
+        as it is garbage collected and its id could be reused.
+        """
+        target_id = _TargetId(id(cls))
+        if target_id not in self.targets:
+            try:
+                self.targets[target_id] = weakref.ref(
+                    cls,
+                    functools.partial(self.forget_target, target_id),
+                )
+            except TypeError:
+                # keep not weak referencable targets alive instead
+                self.targets[target_id] = cls
+        return (target_id, method)
+
+    def forget_target(self, target_id: _TargetId, _: weakref.ref) -> None:
+        self.targets.pop(target_id, None)
+        for registry in (
+            self.mocked_calls_registry,
+            self.signatures,
+            self.mocks,
+            self.layered,
+        ):
+            for key in [key for key in registry if key[0] == target_id]:
+                del registry[key]
+
+    def get_signature(
+        self,
+        cls: _TargetCls,
+        method: _TargetMethodName,
+    ) -> inspect.Signature:
+        """Return the signature of cls.method, building it once per target.
+
+        The cached entry remembers the callable it was built from and is
+        rebuilt as soon as the attribute points to another callable,
+        i.e. the target was re-patched or replaced in between.
+        """
+        key = self.get_target_key(cls, method)
+        patched_by = self.find_patched_by(key) or self.find_patched_below(key)
+        if patched_by is not None:
+            # the target is patched, the original signature is cached
+            return patched_by.signatures[key][1]
+        origin_callable = getattr(cls, method)
+        cached = self.signatures.get(key)
+        if cached is None or cached[0] != origin_callable:
+            cached = (origin_callable, inspect.signature(origin_callable))
+            self.signatures[key] = cached
+        return cached[1]
+
+    def find_patched_by(
+        self,
+        target_key: _TargetClsMethodKey,
+    ) -> MockedCalls | None:
+        """Return the MockedCalls which patched the target, self or a parent."""
+        mocked_calls: MockedCalls | None = self
+        while mocked_calls is not None:
+            if target_key in mocked_calls.mocks:
+                return mocked_calls
+            mocked_calls = mocked_calls.parent
+        return None
+
+    def find_patched_below(
+        self,
+        target_key: _TargetClsMethodKey,
+    ) -> MockedCalls | None:
+        """Return the MockedCalls of an inner scope which patched the target."""
+        for child in self.children:
+            if target_key in child.patches:
+                return child
+            patched_by = child.find_patched_below(target_key)
+            if patched_by is not None:
+                return patched_by
+        return None
+
+    def adopt(self, child: MockedCalls) -> None:
+        """Make this the parent of the MockedCalls of an inner scope."""
+        child.parent = self
+        self.children.append(child)
+
+    def take_over(
+        self,
+        target_key: _TargetClsMethodKey,
+        patched_by: MockedCalls,
+    ) -> None:
+        """Patch the target patched by a child below the child's mocked calls.
+
+        The side effect of the mock is rebuilt on the mocked calls of this
+        registry, with the child's ones as their layer, and the patch is
+        moved here, so it outlives the child and is stopped by the mocker
+        of this registry.
+        """
+        mocked_calls = self.mocked_calls_registry[target_key]
+        above = patched_by.mocked_calls_registry[target_key]
+        mocked_calls.layer = above
+        layer: MockedCallsIndex | None = above
+        while layer is not None:
+            layer.target_stats = mocked_calls.target_stats
+            for stub_stats in layer.stats.stubs.values():
+                stub_stats.count_misses(mocked_calls.target_stats)
+            layer = layer.layer
+        patched_by.layered[target_key] = mocked_calls
+        patch = self.patches[target_key] = patched_by.patches.pop(target_key)
+        untrack_patch(patched_by.mocker, patch)
+        self.mocker._mock_cache.add(
+            mock=patched_by.mocks[target_key], patch=patch
+        )
+        self.signatures[target_key] = patched_by.signatures[target_key]
+        mock = self.mocks[target_key] = patched_by.mocks[target_key]
+        origin_callable, origin_callable_sig = self.signatures[target_key]
+        # the autospec functions are wrappers of their mocks
+        wrapped: Any = getattr(mock, "mock", mock)
+        wrapped.side_effect = side_effect_factory(
+            origin_callable=origin_callable,
+            origin_callable_sig=origin_callable_sig,
+            mocked_calls=mocked_calls,
+            instrument=self.instrument,
+        )
+        if self.instrument:
+            mock.when_stats = mocked_calls.stats
+        if above.call_log is not None:
+            mocked_calls.call_log, above.call_log = above.call_log, None
+            mocked_calls.call_log.mocked_calls = mocked_calls
+
+    def is_coroutine_function(
+        self,
+        cls: _TargetCls,
+        method: _TargetMethodName,
+    ) -> bool:
+        """Whether the original cls.method is a coroutine function."""
+        self.get_signature(cls, method)
+        target_key = self.get_target_key(cls, method)
+        patched_by = self.find_patched_by(target_key) or self
+        return inspect.iscoroutinefunction(
+            patched_by.signatures[target_key][0]
+        )
+
+    @property
+    def size(self) -> int:
+        """Number of mocked calls registered for all the targets."""
+        return sum(
+            len(mocked_calls.registered)
+            for mocked_calls in self.mocked_calls_registry.values()
+        )
+
+    def reset_outer_history(self) -> None:
+        """Reset the calls recorded by the mocks of the outer scopes.
+
+        The mocks of the targets patched by the outer scopes are shared
+        with this registry, so they record the calls of this scope only.
+        """
+        parent = self.parent
+        while parent is not None:
+            for target_key in parent.patches:
+                parent.reset_history(target_key)
+            parent = parent.parent
+
+    def reset_history(self, target_key: _TargetClsMethodKey) -> None:
+        """Reset the calls recorded by the mock of the patched target."""
+        mock = self.mocks[target_key]
+        mock.reset_mock()
+        call_log = self.mocked_calls_registry[target_key].call_log
+        if call_log is not None:
+            call_log.clear()
+            unrecord_calls(mock)
+
+    def clear(self) -> None:
+        """Stop the patches and release all the mocked calls."""
+        if self.parent is not None and self in self.parent.children:
+            self.parent.children.remove(self)
+            self.reset_outer_history()
+        for patch in reversed(self.patches.values()):
+            patch.stop()
+            untrack_patch(self.mocker, patch)
+        self.patches.clear()
+        for mocked_calls in self.layered.values():
+            mocked_calls.layer = None
+        self.layered.clear()
+        for mocked_calls in self.mocked_calls_registry.values():
+            mocked_calls.clear()
+        self.mocked_calls_registry.clear()
+        self.signatures.clear()
+        self.targets.clear()
+        self.mocks.clear()
 
     def add_call(
         self,
@@ -198,32 +1681,316 @@ class MockedCalls(
         method: _TargetMethodName,
         args: _TargetMethodArgs,
         kwargs: _TargetMethodKwargs,
-        should_call: _CallLazyValue,
+        should_call: _CallLazyValue | Answer,
+        *,
+        strict: bool | None = None,
     ) -> MagicMock:
-        self.mocked_calls_registry.setdefault(
-            (_TargetClsName(cls.__name__), method),
-            {},
+        """Register the mocked call, see add_calls."""
+        return self.add_calls(
+            cls,
+            method,
+            ((args, kwargs, should_call),),
+            strict=strict,
+        )
+
+    def add_calls(
+        self,
+        cls: _TargetCls,
+        method: _TargetMethodName,
+        calls: Iterable[
+            tuple[
+                _TargetMethodArgs,
+                _TargetMethodKwargs,
+                _CallLazyValue | Answer,
+            ]
+        ],
+        *,
+        strict: bool | None = None,
+    ) -> MagicMock:
+        """Register the mocked calls, patching the target on the first ones.
+
+        The calls are bound to the signature of the target in one pass and
+        registered at once, if any of them doesn't fit, none is registered.
+        The following mocked calls of the same target are only added to
+        its mocked calls, the already installed mock is returned.
+        The patches are indexed here by their target and registered with
+        the mocker, they are stopped by MockedCalls.clear, mocker.stopall
+        or the mocker teardown, whichever comes first.
+
+        strict makes the not matched calls of the target fail instead of
+        calling the original, None keeps the current or the default mode.
+        """
+        target_key = self.get_target_key(cls, method)
+        origin_callable_sig = self.get_signature(cls, method)
+        if target_key not in self.mocked_calls_registry:
+            name = get_target_name(cls, method)
+            self.mocked_calls_registry[target_key] = MockedCallsIndex(
+                origin_callable_sig,
+                name,
+                strict=self.strict,
+                default_strict=self.default_strict,
+                profile=(
+                    None
+                    if self.profile is None
+                    else self.profile.previous.get(name, {})
+                ),
+            )
+            patched_by = (
+                None
+                if self.parent is None
+                else self.parent.find_patched_by(target_key)
+            )
+            if patched_by is not None:
+                # patched in an outer scope, add the mocked calls as a layer
+                below = patched_by.mocked_calls_registry[target_key].layers()[
+                    0
+                ]
+                below.layer = self.mocked_calls_registry[target_key]
+                below.layer.target_stats = below.target_stats
+                self.layered[target_key] = below
+                self.signatures[target_key] = patched_by.signatures[target_key]
+                self.mocks[target_key] = patched_by.mocks[target_key]
+            else:
+                patched_by = self.find_patched_below(target_key)
+                if patched_by is not None:
+                    self.take_over(target_key, patched_by)
+        mocked_calls = self.mocked_calls_registry[target_key]
+        if strict is not None:
+            mocked_calls.strict = strict
+        mock = self.mocks.get(target_key)
+        mocked_calls.update(
+            (
+                (
+                    create_call_key(origin_callable_sig, *args, **kwargs),
+                    should_call,
+                )
+                for args, kwargs, should_call in calls
+            ),
+            calls_before=0 if mock is None else mock.call_count,
+        )
+
+        if target_key not in self.mocks:
+            patch = self.mocker.mock_module.patch.object(
+                cls,
+                method,
+                autospec=True,
+                # it is important to send the origin target to the
+                # side_effect_factory in order the result side_effect stores
+                # the original target.
+                side_effect=side_effect_factory(
+                    origin_callable=getattr(cls, method),
+                    origin_callable_sig=origin_callable_sig,
+                    mocked_calls=mocked_calls,
+                    instrument=self.instrument,
+                ),
+            )
+            self.mocks[target_key] = patch.start()
+            self.patches[target_key] = patch
+            self.mocker._mock_cache.add(
+                mock=self.mocks[target_key], patch=patch
+            )
+            if self.instrument:
+                self.mocks[target_key].when_stats = mocked_calls.stats
+            if self.call_log:
+                self.add_call_log(target_key, origin_callable_sig)
+        return self.mocks[target_key]
+
+    def add_call_log(
+        self,
+        target_key: _TargetClsMethodKey,
+        origin_callable_sig: inspect.Signature,
+    ) -> None:
+        """Log the calls of the patched target instead of its mock."""
+        mocked_calls = self.mocked_calls_registry[target_key]
+        mocked_calls.call_log = CallLog(
+            origin_callable_sig,
+            self.call_log,
+            mocked_calls,
+        )
+        mock = self.mocks[target_key]
+        unrecord_calls(mock)
+        mock.when_call_log = mocked_calls.call_log
+
+
+class Verification(CalledTimes):
+    """Number of the calls of the target matching the called_with spec.
+
+    If the spec is registered with called_with on the target, the calls
+    are counted by its mocked calls during the interception, in all the
+    layers. The counters are used only if they count all the calls
+    matching the spec: the target wasn't called before the registration,
+    none of the mocked calls checked before, i.e. registered before or in
+    a higher layer, could match the same calls, and none is registered by
+    an outer scope, whose counters include the calls of the earlier
+    tests. Otherwise the calls recorded by the mock, or by its CallLog,
+    since this scope was set up are matched against the spec compiled
+    like a mocked call.
+    """
+
+    def __init__(
+        self,
+        mocked_calls: MockedCalls,
+        cls: _TargetCls,
+        method: _TargetMethodName,
+        call_key: _CallKey,
+    ) -> None:
+        self.mocked_calls = mocked_calls
+        self.cls = cls
+        self.method = method
+        self.call_key = call_key
+
+    @property
+    def count(self) -> int:
+        """Number of the calls matching the spec."""
+        target_key = self.mocked_calls.get_target_key(self.cls, self.method)
+        # the layers are added on the mocked calls of the patching scope
+        patched_by: MockedCalls | None = self.mocked_calls
+        while patched_by is not None and target_key not in patched_by.patches:
+            patched_by = patched_by.parent
+        if patched_by is None:
+            raise ValueError(
+                f"{get_target_name(self.cls, self.method)} "
+                "is not patched by when"
+            )
+        layers = []
+        mocked_calls: MockedCallsIndex | None = (
+            patched_by.mocked_calls_registry[target_key]
+        )
+        while mocked_calls is not None:
+            layers.append(mocked_calls)
+            mocked_calls = mocked_calls.layer
+        # the counters of the outer scopes span the earlier tests
+        outer_layers = set()
+        outer_scope = self.mocked_calls.parent
+        while outer_scope is not None:
+            outer_layer = outer_scope.mocked_calls_registry.get(target_key)
+            if outer_layer is not None:
+                outer_layers.add(id(outer_layer))
+            outer_scope = outer_scope.parent
+        counted = [
+            layer for layer in layers if self.call_key in layer.matchers
+        ]
+        matchers = [layer.matchers[self.call_key] for layer in counted]
+        if (
+            matchers
+            and all(id(layer) not in outer_layers for layer in counted)
+            and not any(
+                self.is_shadowed(matcher, layers) for matcher in matchers
+            )
+        ):
+            return sum(matcher.calls for matcher in matchers)
+        return self.count_recorded(
+            patched_by.signatures[target_key][1],
+            patched_by.mocks[target_key],
+        )
+
+    def is_shadowed(
+        self,
+        matcher: CallMatcher,
+        layers: list[MockedCallsIndex],
+    ) -> bool:
+        """Whether the counter of the matcher misses some matching calls.
+
+        The layers are ordered from the bottom one, the mocked calls of
+        the higher layers are checked first.
+        """
+        checked_before = itertools.takewhile(
+            lambda other: other is not matcher,
+            itertools.chain.from_iterable(
+                layer.matchers.values() for layer in reversed(layers)
+            ),
+        )
+        return matcher.calls_before > 0 or any(
+            other.call_key != self.call_key
+            and not are_disjoint(matcher, other)
+            for other in checked_before
+        )
+
+    def count_recorded(
+        self,
+        original_callable_sig: inspect.Signature,
+        mock: MagicMock,
+    ) -> int:
+        """Match the calls recorded by the mock against the spec."""
+        spec = MockedCallsIndex(original_callable_sig)
+        spec[self.call_key] = lazy_return(None)
+        call_log: CallLog | None = getattr(mock, "when_call_log", None)
+        if call_log is None:
+            return sum(
+                spec.find(
+                    original_callable_sig.bind(*call.args, **call.kwargs)
+                )
+                is not None
+                for call in mock.call_args_list
+            )
+        if any(
+            matcher.arguments or matcher.nested
+            for matcher in spec.matchers.values()
+        ):
+            raise ValueError(
+                "The calls logged by the CallLog are matched by the values "
+                "and Markers.any only, register the called_with spec with "
+                "the other Markers before the calls to count them"
+            )
+        return call_log.count_arguments(dict(self.call_key))
+
+    def check(self, expected: str, *, passed: bool, count: int) -> None:
+        """Fail with the expected and the actual number of the calls."""
+        if not passed:
+            raise AssertionError(
+                f"Expected {expected} of "
+                f"{get_target_name(self.cls, self.method)} with "
+                f"{_described_value_repr.repr(self.call_key)}, "
+                f"got {count}"
+            )
+
+    def times(self, times: int) -> None:
+        """Check the target was called times times with the spec."""
+        count = self.count
+        self.check(f"{times} calls", passed=count == times, count=count)
+
+    def never(self) -> None:
+        """Check the target was never called with the spec."""
+        self.times(0)
+
+    def at_least(self, times: int) -> None:
+        """Check the target was called at least times times with the spec."""
+        count = self.count
+        self.check(
+            f"at least {times} calls",
+            passed=count >= times,
+            count=count,
+        )
+
+
+class Verify(VerifyResponse):
+    """Verification of the calls of cls.method, see When.verify."""
+
+    def __init__(
+        self,
+        mocked_calls: MockedCalls,
+        cls: _TargetCls,
+        method: _TargetMethodName,
+    ) -> None:
+        self.mocked_calls = mocked_calls
+        self.cls = cls
+        self.method = method
+
+    def called_with(self, *args, **kwargs) -> Verification:
+        """Specify args and kwargs of the calls to verify."""
+        original_callable_sig = self.mocked_calls.get_signature(
+            self.cls,
+            self.method,
         )
-        self.mocked_calls_registry[(_TargetClsName(cls.__name__), method)][
+        return Verification(
+            self.mocked_calls,
+            self.cls,
+            self.method,
             create_call_key(
-                inspect.signature(getattr(cls, method)),
+                original_callable_sig,
+                *get_args_prefix(original_callable_sig),
                 *args,
                 **kwargs,
-            )
-        ] = should_call
-
-        return self.mocker.patch.object(
-            cls,
-            method,
-            autospec=True,
-            # it is important to send the origin target to the
-            # side_effect_factory in order the result side_effect stores
-            # the original target.
-            side_effect=side_effect_factory(
-                origin_callable=getattr(cls, method),
-                mocked_calls=self.mocked_calls_registry[
-                    (_TargetClsName(cls.__name__), method)
-                ],
             ),
         )
 
@@ -293,6 +2060,10 @@ class When(
     Instead of ".then_return", there are ".then_call" and  ".then_raise"
     methods are avaialble
 
+    With when(cls, method, strict=True) the calls not matching any
+    "called_with" fail with UnmatchedCallError instead of calling the
+    original method.
+
     """
 
     cls: _TargetCls
@@ -301,42 +2072,100 @@ class When(
     args: _TargetMethodArgs
     kwargs: _TargetMethodKwargs
 
+    strict: bool | None
+
     markers = Markers
+    exhausted = Exhausted
 
-    def __init__(self, mocker: MockerFixture):
+    def __init__(
+        self,
+        mocker: MockerFixture,
+        *,
+        instrument: bool = False,
+        strict: bool | None = None,
+        default_strict: bool = False,
+        call_log: int = 0,
+        profile: StubProfile | None = None,
+        parent: MockedCalls | None = None,
+    ):
         self.mocker = mocker
         self.mocked_calls = MockedCalls[
             _TargetCls,
             _TargetMethodParams,
             _TargetMethodReturn,
-        ](self.mocker)
+        ](
+            self.mocker,
+            instrument=instrument,
+            strict=strict,
+            default_strict=default_strict,
+            call_log=call_log,
+            profile=profile,
+            parent=parent,
+        )
 
     def __call__(
         self,
         cls: _TargetCls,
         method: _TargetMethodName,
+        *,
+        strict: bool | None = None,
     ) -> WhenResponse:
-        def already_mocked(mock: MockCacheItem) -> bool:
-            return mock.patch.target is cls and mock.patch.attribute == method  # type: ignore
+        if self.is_mocked_outside(cls, method):
+            # autospec refuses targets mocked outside of the when fixture
+            mock_cache = self.mocker._mock_cache.cache
+            for mock in [
+                mock
+                for mock in mock_cache
+                if mock.patch.target is cls and mock.patch.attribute == method  # type: ignore
+            ]:
+                mock.patch.stop()  # type: ignore
+                mock_cache.remove(mock)
 
-        def stop_patching(mock: MockCacheItem) -> MockCacheItem:
-            mock.patch.stop()  # type: ignore
-            return mock
+        self.cls = cls
+        self.method = method
+        self.strict = strict
+        return self
 
-        def remove_mock_item_from_cache(mock: MockCacheItem) -> None:
-            self.mocker._mock_cache.cache.remove(mock)
+    def is_mocked_outside(
+        self,
+        cls: _TargetCls,
+        method: _TargetMethodName,
+    ) -> bool:
+        """Whether cls.method is a mock not installed by the when fixture.
 
-        (
-            Seq[MockCacheItem](self.mocker._mock_cache.cache)
-            .filter(already_mocked)
-            .map(stop_patching)
-            .map(remove_mock_item_from_cache)
-            .exhaust()
+        The functions patched with autospec are wrappers keeping their
+        mock as the mock attribute.
+        """
+        attribute = getattr(cls, method, None)
+        non_callable_mock = self.mocker.NonCallableMock
+        if not isinstance(attribute, non_callable_mock) and not isinstance(
+            getattr(attribute, "mock", None), non_callable_mock
+        ):
+            return False
+        target_key = self.mocked_calls.get_target_key(cls, method)
+        return (
+            self.mocked_calls.find_patched_by(target_key) is None
+            and self.mocked_calls.find_patched_below(target_key) is None
         )
 
-        self.cls = cls
-        self.method = method
-        return self
+    def verify(self, cls: _TargetCls, method: _TargetMethodName) -> Verify:
+        """Verify the calls of cls.method patched by when.
+
+        Example:
+        >>> when.verify(Klass1, "some_method").called_with(
+        >>>     "a",
+        >>>     when.markers.any,
+        >>>     kwarg1="b",
+        >>>     kwarg2="c",
+        >>> ).times(2)
+
+        The calls matching a spec registered with called_with are counted
+        during the interception, so verifying them doesn't scan the calls,
+        unless the other mocked calls could take some of them. The other
+        specs are matched against the calls recorded by the mock.
+
+        """
+        return Verify(self.mocked_calls, cls, method)
 
     def called_with(
         self,
@@ -361,23 +2190,75 @@ class When(
         any kwarg2 kwarg
 
         """
-        params = tuple(
-            inspect.signature(
-                getattr(
-                    self.cls,
-                    self.method,
-                )
-            ).parameters
-        )
-        is_instance_method = False if not params else params[0] == "self"
-        # prepend Markers.any in case of a method (for self arg)
-        self.args = (Markers.any, *args) if is_instance_method else args
+        self.args = self.get_args_prefix() + args
         self.kwargs = kwargs
         return self
 
+    def get_args_prefix(self) -> _TargetMethodArgs:
+        """Return Markers.any for the self arg in case of a method."""
+        return get_args_prefix(
+            self.mocked_calls.get_signature(self.cls, self.method)
+        )
+
+    def called_with_table(
+        self,
+        rows: Iterable[tuple[_TargetMethodArgs, _TargetMethodKwargs, Any]],
+    ) -> MagicMock:
+        """Return the result of the row which args and kwargs match the call.
+
+        The same as the called_with(*args, **kwargs).then_return(result)
+        for every row, but the rows are registered at once and the target
+        is patched only once. If any row doesn't fit the target signature,
+        none is registered.
+
+        Example:
+        >>> when(Klass1, "some_method").called_with_table(
+        >>>     [
+        >>>         (("a", 1), {"kwarg1": "b", "kwarg2": "c"}, "Mocked a"),
+        >>>         (("b", 1), {"kwarg1": "b", "kwarg2": "c"}, "Mocked b"),
+        >>>     ]
+        >>> )
+
+        """
+        prefix = self.get_args_prefix()
+        return self.mocked_calls.add_calls(
+            self.cls,
+            self.method,
+            (
+                (prefix + tuple(args), kwargs, lazy_return(result))
+                for args, kwargs, result in rows
+            ),
+            strict=self.strict,
+        )
+
     def then_return(self, value: _TargetMethodReturn) -> MagicMock:
         """Return value in case the called_with specification will match the call."""
-        return self.then_call(lambda: value)
+        return self.then_call(lazy_return(value))
+
+    def then_return_after(
+        self,
+        value: _TargetMethodReturn,
+        delay: float,
+    ) -> MagicMock:
+        """Return value after delay seconds in case the called_with specification will match the call.
+
+        For coroutine functions the delay is awaited with asyncio.sleep,
+        so the other tasks keep running, delay=0 only yields to the event
+        loop once. Other callables sleep with time.sleep.
+        """
+        if self.mocked_calls.is_coroutine_function(self.cls, self.method):
+
+            async def _return_after() -> _TargetMethodReturn:
+                await asyncio.sleep(delay)
+                return value
+
+            return self.then_call(_return_after)
+
+        def _sleep_and_return() -> _TargetMethodReturn:
+            time.sleep(delay)
+            return value
+
+        return self.then_call(_sleep_and_return)
 
     def then_call(self, callable_: _CallLazyValue) -> MagicMock:
         """Call the callable_ in case the called_with specification will match the call.
@@ -393,6 +2274,9 @@ class When(
         >>>    .then_call(functools.partial(foo_patched, *foo_args, **foo_kwargs)
         >>> )
 
+        For coroutine functions the callable can be a coroutine function
+        too, its result is awaited.
+
         """
         return self.mocked_calls.add_call(
             self.cls,
@@ -400,6 +2284,34 @@ class When(
             self.args,
             self.kwargs,
             callable_,
+            strict=self.strict,
+        )
+
+    def then_answer(
+        self,
+        answer: Callable[[inspect.BoundArguments], _TargetMethodReturn],
+    ) -> MagicMock:
+        """Call the answer with the matched call and return its result.
+
+        The answer gets the inspect.BoundArguments of the call with the
+        defaults applied, so a single mocked call could compute the result
+        from the arguments instead of listing every call.
+
+        Example:
+        >>> (
+        >>>    when(example_module, "some_normal_function")
+        >>>    .called_with("a", when.markers.any, kwarg1="b", kwarg2="c")
+        >>>    .then_answer(lambda call: f"Mocked {call.arguments['arg2']}")
+        >>> )
+
+        """
+        return self.mocked_calls.add_call(
+            self.cls,
+            self.method,
+            self.args,
+            self.kwargs,
+            Answer(answer),
+            strict=self.strict,
         )
 
     def then_raise(self, exc: BaseException) -> MagicMock:
@@ -410,9 +2322,38 @@ class When(
 
         return self.then_call(lambda: _raise_exc(exc))
 
+    def then_return_many(
+        self,
+        values: Iterable[_TargetMethodReturn],
+        on_exhausted: Exhausted = Exhausted.error,
+    ) -> MagicMock:
+        """Return the next of values on every call matching the called_with specification.
+
+        The values are consumed lazily, so they could be a generator of
+        responses, which are never built all at once.
+        Once the values are exhausted, depending on on_exhausted, the call
+        raises ResponsesExhaustedError, returns the last value again, or
+        falls through to the original callable like a not matched call.
+
+        Example:
+        >>> when(Client, "get_page").called_with(when.markers.any).then_return_many(
+        >>>     (make_page(number) for number in range(1000)),
+        >>>     on_exhausted=when.exhausted.repeat_last,
+        >>> )
+
+        """
+        return self.then_call(lazy_return_many(values, on_exhausted))
+
+    def then_cycle(self, values: Iterable[_TargetMethodReturn]) -> MagicMock:
+        """Return the values in a loop on the calls matching the called_with specification."""
+        return self.then_return_many(itertools.cycle(values))
+
 
 @pytest.fixture
-def when(mocker: MockerFixture) -> WhenInitial:
+def when(
+    mocker: MockerFixture,
+    request: pytest.FixtureRequest,
+) -> Iterator[WhenInitial]:
     """Patching utility focused on readability.
 
     Example:
@@ -465,5 +2406,133 @@ def when(mocker: MockerFixture) -> WhenInitial:
 
     You can also patch multiple targets (cls, method)
 
+    The calls not matching any "called_with" fail with UnmatchedCallError
+    instead of calling the original when strict: per target with
+    when(cls, method, strict=True), or by default with the when_strict
+    ini option or the when_strict marker.
+
+    With the when_call_log ini option, the mocks don't keep their calls,
+    the last calls are logged compactly in the when_call_log attribute
+    of the mocks instead.
+
+    With the when_adaptive ini option, the mocked calls which can't match
+    the same calls are checked in the order of their hits, the hits are
+    saved in the pytest cache for the next session.
+
+    The mocked calls are owned by the fixture and released on the test
+    teardown. The targets patched by the when_module or when_session
+    fixtures are not patched again, the mocked calls of the test take
+    precedence over theirs until the test teardown.
+
     """
-    return When(mocker)
+    yield from use_when(mocker, request)
+
+
+@pytest.fixture(scope="module")
+def when_module(
+    module_mocker: MockerFixture,
+    request: pytest.FixtureRequest,
+) -> Iterator[WhenInitial]:
+    """Patch the targets of the when fixture once per module.
+
+    The tests using the when fixture in the module can add or override
+    the mocked calls of these targets, it is rolled back at the test
+    teardown without patching the targets again.
+    """
+    yield from use_when(module_mocker, request)
+
+
+@pytest.fixture(scope="session")
+def when_session(
+    session_mocker: MockerFixture,
+    request: pytest.FixtureRequest,
+) -> Iterator[WhenInitial]:
+    """Patch the targets of the when fixture once per session.
+
+    The when_module and when fixtures can add or override the mocked calls
+    of these targets, it is rolled back at their teardown without patching
+    the targets again.
+    """
+    yield from use_when(session_mocker, request)
+
+
+# the active when fixtures with their scopes, in the order of the setup
+when_stack_key = pytest.StashKey[list[tuple[str, When]]]()
+
+# the scopes of the when fixtures, from the outermost one
+WHEN_SCOPES = ("session", "module", "function")
+
+
+def find_parent(
+    when_stack: list[tuple[str, When]],
+    scope: str,
+) -> MockedCalls | None:
+    """Return the mocked calls of the innermost outer scope, if active.
+
+    The when fixture of an outer scope could be set up after the ones of
+    the inner scopes, e.g. when_session first requested in a module using
+    when_module, so the parent is chosen by the scope, not the setup.
+    """
+    for outer_scope in reversed(WHEN_SCOPES[: WHEN_SCOPES.index(scope)]):
+        for when_scope, when_ in reversed(when_stack):
+            if when_scope == outer_scope:
+                return when_.mocked_calls
+    return None
+
+
+def use_when(
+    mocker: MockerFixture,
+    request: pytest.FixtureRequest,
+) -> Iterator[When]:
+    """Yield a When on top of the when fixtures of the outer scopes."""
+    when_stack = request.config.stash.setdefault(when_stack_key, [])
+    session_stats = request.config.stash.get(session_stats_key, None)
+    stub_profile = request.config.stash.get(stub_profile_key, None)
+    strict_marker = request.node.get_closest_marker("when_strict")
+    when_: When[Any, Any, Any] = When(
+        mocker,
+        instrument=session_stats is not None,
+        strict=(
+            None
+            if strict_marker is None
+            else strict_marker.args[0] if strict_marker.args else True
+        ),
+        default_strict=request.config.getini("when_strict"),
+        call_log=int(request.config.getini("when_call_log")),
+        profile=stub_profile,
+        parent=find_parent(when_stack, request.scope),
+    )
+    for when_scope, inner_when in when_stack:
+        if (
+            WHEN_SCOPES.index(when_scope) > WHEN_SCOPES.index(request.scope)
+            and inner_when.mocked_calls.parent is None
+        ):
+            # set up before this outer scope, e.g. when_session first
+            # requested in a module using when_module
+            when_.mocked_calls.adopt(inner_when.mocked_calls)
+    when_stack.append((request.scope, when_))
+    yield when_
+    when_stack.remove((request.scope, when_))
+    # the nodeid of the session is empty
+    nodeid = request.node.nodeid or "<session>"
+    registry_stats = request.config.stash.get(registry_stats_key, None)
+    if registry_stats is not None:
+        registry_stats.update(when_.mocked_calls.size, nodeid)
+    if session_stats is not None:
+        session_stats.add(
+            nodeid,
+            (
+                mocked_calls.stats
+                for mocked_calls in when_.mocked_calls.mocked_calls_registry.values()
+            ),
+        )
+    if stub_profile is not None:
+        for mocked_calls in when_.mocked_calls.mocked_calls_registry.values():
+            stub_profile.add(
+                mocked_calls.stats.name,
+                (
+                    (stub_id, matcher.calls)
+                    for matcher, stub_id in mocked_calls.stub_ids.items()
+                ),
+            )
+    when_.mocked_calls.clear()
@@ -17,3 +17,7 @@ def some_foo_with_variadic_args_kwargs(
 
 def some_foo_without_args() -> str:
     return "Not mocked"
+
+
+async def some_async_foo(arg: int) -> str:
+    return "Not mocked"
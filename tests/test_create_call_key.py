@@ -1,3 +1,4 @@
+import enum
 import inspect
 
 import pytest
@@ -179,3 +180,29 @@ def test_should_work_with_variadic_args_and_kwargs():
             ),
         ),
     )
+
+
+def test_should_make_nested_containers_hashable():
+    class Flag(enum.IntEnum):
+        on = 1
+
+    actual = create_call_key(
+        inspect.signature(foo),
+        [1, "2", None, Markers.any],
+        {"flat": {"a": 1.0, "b": b"2"}, "nested": [[1, 2], {3}]},
+        c_kw=Flag.on,
+        d_kw={"flag": Flag.on, "items": [Flag.on]},
+    )
+    assert actual == (
+        ("a_arg", (1, "2", None, Markers.any)),
+        (
+            "b_arg",
+            (
+                ("flat", (("a", 1.0), ("b", b"2"))),
+                ("nested", ((1, 2), (3,))),
+            ),
+        ),
+        ("c_kw", Flag.on),
+        ("d_kw", (("flag", Flag.on), ("items", (Flag.on,)))),
+    )
+    hash(actual)
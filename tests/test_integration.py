@@ -1,7 +1,20 @@
+import asyncio
+import functools
+import gc
+import inspect
 import re
+import time
 
 import pytest
 
+from pytest_when.when import (
+    MockedCallsIndex,
+    ResponsesExhaustedError,
+    UnmatchedCallError,
+    When,
+    get_target_name,
+    side_effect_factory,
+)
 from tests.resources import example_module
 
 
@@ -371,3 +384,1112 @@ def test_then_raise_should_work(when):
     with pytest.raises(ValueError, match=re.compile("Error msg")):
         example_module.some_foo_without_args()
     patched_foo.assert_called()
+
+
+def test_should_build_the_signature_once_per_target(when):
+    signature = when.mocked_calls.get_signature(Klass1, "some_method")
+
+    when(Klass1, "some_method").called_with(
+        "a",
+        when.markers.any,
+        kwarg1="b",
+        kwarg2=when.markers.any,
+    ).then_return("Mocked")
+    when(Klass1, "some_method").called_with(
+        "b",
+        when.markers.any,
+        kwarg1="b",
+        kwarg2=when.markers.any,
+    ).then_return("Mocked b")
+
+    assert Klass1().some_method("a", 1, kwarg1="b", kwarg2="c") == "Mocked"
+    assert Klass1().some_method("b", 1, kwarg1="b", kwarg2="c") == "Mocked b"
+    assert [
+        cached_signature
+        for _, cached_signature in when.mocked_calls.signatures.values()
+    ] == [signature]
+
+
+def test_should_rebuild_the_signature_if_target_was_replaced(
+    when,
+    monkeypatch,
+):
+    class Replaceable:
+        @staticmethod
+        def foo(a):  # noqa: ARG004
+            return "Not mocked"
+
+    def replaced_foo(a, b):
+        return "Replaced"
+
+    signature = when.mocked_calls.get_signature(Replaceable, "foo")
+    monkeypatch.setattr(Replaceable, "foo", replaced_foo)
+
+    patched_foo = (
+        when(Replaceable, "foo").called_with(1, 2).then_return("Mocked")
+    )
+
+    assert Replaceable.foo(1, 2) == "Mocked"
+    assert Replaceable.foo(2, 1) == "Replaced"
+    assert when.mocked_calls.get_signature(Replaceable, "foo") is not signature
+    patched_foo.assert_called()
+
+
+def test_should_not_mix_targets_with_the_same_name(when):
+    def make_klass():
+        class Klass:
+            def some_method(self, arg1: str) -> str:
+                return "Not mocked"
+
+        return Klass
+
+    klass_a, klass_b = make_klass(), make_klass()
+    when(klass_a, "some_method").called_with("a").then_return("Mocked a")
+    when(klass_b, "some_method").called_with("b").then_return("Mocked b")
+
+    assert klass_a().some_method("a") == "Mocked a"
+    assert klass_a().some_method("b") == "Not mocked"
+    assert klass_b().some_method("a") == "Not mocked"
+    assert klass_b().some_method("b") == "Mocked b"
+
+
+def test_should_forget_garbage_collected_targets(when):
+    class Klass:
+        def some_method(self, arg1: str) -> str:
+            return "Not mocked"
+
+    when.mocked_calls.get_signature(Klass, "some_method")
+    assert len(when.mocked_calls.signatures) == 1
+
+    del Klass
+    gc.collect()
+
+    assert when.mocked_calls.signatures == {}
+    assert when.mocked_calls.targets == {}
+
+
+def test_should_keep_not_weak_referencable_targets_alive(when):
+    target = ("some", "tuple")
+    target_key = when.mocked_calls.get_target_key(target, "count")
+    assert target_key == (id(target), "count")
+    assert when.mocked_calls.targets[id(target)] is target
+
+
+def test_should_patch_the_target_only_once(when):
+    handles = [
+        when(Klass1, "some_method")
+        .called_with(arg1, when.markers.any, kwarg1="b", kwarg2="c")
+        .then_return(f"Mocked {arg1}")
+        for arg1 in ("a", "b", "c")
+    ]
+
+    assert Klass1().some_method("b", 1, kwarg1="b", kwarg2="c") == "Mocked b"
+    assert list(when.mocked_calls.patches) == [
+        when.mocked_calls.get_target_key(Klass1, "some_method"),
+    ]
+    assert handles[0] is handles[1] is handles[2]
+    handles[0].assert_called_once()
+
+
+def test_should_replace_patches_installed_outside_of_when(when, mocker):
+    mocker.patch.object(
+        example_module,
+        "some_normal_function",
+        return_value="Patched outside",
+    )
+
+    when(example_module, "some_normal_function").called_with(
+        "a",
+        when.markers.any,
+        kwarg1="b",
+        kwarg2=when.markers.any,
+    ).then_return("Mocked")
+
+    assert (
+        example_module.some_normal_function("a", 1, kwarg1="b", kwarg2="c")
+        == "Mocked"
+    )
+    assert (
+        example_module.some_normal_function("b", 1, kwarg1="b", kwarg2="c")
+        == "Not mocked"
+    )
+
+
+def test_should_replace_autospec_patches_installed_outside_of_when(
+    when, mocker
+):
+    mocker.patch.object(
+        example_module,
+        "some_normal_function",
+        autospec=True,
+        return_value="Patched outside",
+    )
+
+    when(example_module, "some_normal_function").called_with(
+        "a",
+        when.markers.any,
+        kwarg1="b",
+        kwarg2=when.markers.any,
+    ).then_return("Mocked")
+
+    assert (
+        example_module.some_normal_function("a", 1, kwarg1="b", kwarg2="c")
+        == "Mocked"
+    )
+    assert (
+        example_module.some_normal_function("b", 1, kwarg1="b", kwarg2="c")
+        == "Not mocked"
+    )
+
+
+def test_should_take_over_targets_patched_by_inner_scopes(mocker):
+    outer = When(mocker, instrument=True, call_log=10)
+    middle = When(mocker, parent=outer.mocked_calls)
+    inner = When(
+        mocker, instrument=True, call_log=10, parent=middle.mocked_calls
+    )
+    inner(Klass1, "some_method").called_with(
+        "a", 1, kwarg1="b", kwarg2="c"
+    ).then_return("Inner")
+    patched = (
+        outer(Klass1, "some_method")
+        .called_with(
+            outer.markers.any,
+            1,
+            kwarg1=outer.markers.any,
+            kwarg2=outer.markers.any,
+        )
+        .then_return("Outer")
+    )
+
+    assert Klass1().some_method("a", 1, kwarg1="b", kwarg2="c") == "Inner"
+    assert Klass1().some_method("b", 1, kwarg1="b", kwarg2="c") == "Outer"
+    target_key = outer.mocked_calls.get_target_key(Klass1, "some_method")
+    mocked_calls = outer.mocked_calls.mocked_calls_registry[target_key]
+    assert patched.when_stats is mocked_calls.stats
+    assert patched.when_call_log is mocked_calls.call_log
+    assert [mocked_calls.stats.calls, len(patched.when_call_log)] == [2, 2]
+    stubs = [
+        *inner.mocked_calls.mocked_calls_registry[
+            target_key
+        ].stats.stubs.values(),
+        *mocked_calls.stats.stubs.values(),
+    ]
+    assert [(stub.matches, stub.misses) for stub in stubs] == [(1, 1), (1, 1)]
+
+    inner.mocked_calls.clear()
+    middle.mocked_calls.clear()
+    assert Klass1().some_method("a", 1, kwarg1="b", kwarg2="c") == "Outer"
+    assert outer.mocked_calls.children == []
+
+    outer.mocked_calls.clear()
+    assert Klass1().some_method("a", 1, kwarg1="b", kwarg2="c") == "Not mocked"
+
+
+def test_should_stop_patches_on_clear(when):
+    when(example_module, "some_foo_without_args").called_with().then_return(
+        "Mocked"
+    )
+    assert example_module.some_foo_without_args() == "Mocked"
+
+    when.mocked_calls.clear()
+
+    assert example_module.some_foo_without_args() == "Not mocked"
+
+
+def test_mocker_should_stop_the_patches(mocker):
+    when_ = When(mocker)
+    when_(example_module, "some_foo_without_args").called_with().then_return(
+        "Mocked"
+    )
+    assert example_module.some_foo_without_args() == "Mocked"
+
+    mocker.stopall()
+
+    assert example_module.some_foo_without_args() == "Not mocked"
+    when_.mocked_calls.clear()
+
+
+def test_should_move_the_taken_over_patches_to_the_outer_mocker(
+    mocker, module_mocker
+):
+    outer = When(module_mocker)
+    inner = When(mocker, parent=outer.mocked_calls)
+    inner(example_module, "some_foo_without_args").called_with().then_return(
+        "Inner"
+    )
+    outer(example_module, "some_foo_without_args").called_with().then_return(
+        "Outer"
+    )
+
+    mocker.stopall()
+    inner.mocked_calls.clear()
+
+    assert example_module.some_foo_without_args() == "Outer"
+    module_mocker.stopall()
+    assert example_module.some_foo_without_args() == "Not mocked"
+    outer.mocked_calls.clear()
+
+
+def test_then_call_should_not_swallow_key_errors(when):
+    def raise_key_error():
+        raise KeyError("missing")
+
+    when(example_module, "some_foo_without_args").called_with().then_call(
+        raise_key_error
+    )
+    with pytest.raises(KeyError, match="missing"):
+        example_module.some_foo_without_args()
+
+
+@pytest.fixture
+def instrumented_when(mocker):
+    return When(mocker, instrument=True)
+
+
+@pytest.fixture(params=[False, True], ids=["plain", "instrumented"])
+def either_when(mocker, request):
+    """When with the side effects timed or not, counted anyway."""
+    return When(mocker, instrument=request.param)
+
+
+def test_should_count_calls_per_mocked_call(instrumented_when):
+    when = instrumented_when
+    when(Klass1, "some_method").called_with(
+        "a",
+        when.markers.any,
+        kwarg1="b",
+        kwarg2=when.markers.any,
+    ).then_return("Mocked a")
+    patched_klass = (
+        when(Klass1, "some_method")
+        .called_with("b", 1, kwarg1="b", kwarg2="c")
+        .then_return("Mocked b")
+    )
+
+    for arg1 in ("a", "a", "b", "not mocked param"):
+        Klass1().some_method(arg1, 1, kwarg1="b", kwarg2="c")
+
+    stats = patched_klass.when_stats
+    assert stats.name == "test_integration.Klass1.some_method"
+    assert (stats.calls, stats.misses, stats.fallthroughs) == (4, 1, 1)
+    assert [stub.matches for stub in stats.stubs.values()] == [2, 1]
+    assert [stats.stub_misses(call_key) for call_key in stats.stubs] == [2, 3]
+    assert all(stub.matching_time > 0 for stub in stats.stubs.values())
+    assert stats.matching_time > 0
+    assert stats.stubs_time > 0
+    assert stats.original_time > 0
+
+
+def test_should_count_strict_misses(mocker):
+    mocked_calls = MockedCallsIndex(
+        inspect.signature(Klass1.some_method),
+        strict=True,
+    )
+    side_effect = side_effect_factory(
+        Klass1.some_method,
+        inspect.signature(Klass1.some_method),
+        mocked_calls,
+        instrument=True,
+    )
+
+    with pytest.raises(UnmatchedCallError):
+        side_effect(Klass1(), "a", 1, kwarg1="b", kwarg2="c")
+
+    stats = mocked_calls.stats
+    assert (stats.calls, stats.misses, stats.fallthroughs) == (1, 1, 0)
+
+
+def test_strict_should_not_be_caught_as_lookup_error(when):
+    when(Klass1, "some_method", strict=True).called_with(
+        "a", 1, kwarg1="b", kwarg2="c"
+    ).then_return("Mocked")
+
+    def code_under_test() -> str:
+        try:
+            return Klass1().some_method("b", 1, kwarg1="b", kwarg2="c")
+        except LookupError:
+            return "Missing"
+
+    with pytest.raises(UnmatchedCallError):
+        code_under_test()
+
+
+def test_strict_should_fail_unmatched_calls(when):
+    when(Klass1, "some_method", strict=True).called_with(
+        "a",
+        when.markers.any,
+        kwarg1="b",
+        kwarg2=when.markers.any,
+    ).then_return("Mocked")
+
+    assert Klass1().some_method("a", 1, kwarg1="b", kwarg2="c") == "Mocked"
+    with pytest.raises(
+        UnmatchedCallError,
+        match=re.escape("of test_integration.Klass1.some_method doesn't"),
+    ):
+        Klass1().some_method("b", 1, kwarg1="b", kwarg2="c")
+
+
+def test_strict_should_be_kept_by_the_following_mocked_calls(when):
+    when(
+        example_module, "some_foo_with_variadic_args_kwargs", strict=True
+    ).called_with(1, 2, 3).then_return("Mocked")
+    when(example_module, "some_foo_with_variadic_args_kwargs").called_with(
+        2, 2, 3
+    ).then_return("Mocked")
+    with pytest.raises(UnmatchedCallError):
+        example_module.some_foo_with_variadic_args_kwargs(3, 2, 3)
+
+    when(
+        example_module, "some_foo_with_variadic_args_kwargs", strict=False
+    ).called_with(2, 2, 3).then_return("Mocked")
+    assert (
+        example_module.some_foo_with_variadic_args_kwargs(3, 2, 3)
+        == "Not mocked"
+    )
+
+
+@pytest.mark.when_strict
+def test_strict_should_be_enabled_by_the_marker(when):
+    when(example_module, "some_foo_with_variadic_args_kwargs").called_with(
+        1, 2, 3
+    ).then_return("Mocked")
+    when(Klass1, "some_method", strict=False).called_with(
+        "a", 1, kwarg1="b", kwarg2="c"
+    ).then_return("Mocked")
+
+    with pytest.raises(UnmatchedCallError):
+        example_module.some_foo_with_variadic_args_kwargs(3, 2, 3)
+    assert Klass1().some_method("b", 1, kwarg1="b", kwarg2="c") == (
+        "Not mocked"
+    )
+
+
+@pytest.mark.parametrize(
+    ("outer_strict", "inner_strict", "default_strict", "fails"),
+    [
+        (True, None, False, True),
+        (True, False, False, False),
+        (None, None, True, True),
+        (False, None, True, False),
+    ],
+)
+def test_layers_should_inherit_the_strict_mode(
+    mocker, outer_strict, inner_strict, default_strict, fails
+):
+    target = (example_module, "some_foo_with_variadic_args_kwargs")
+    outer = When(mocker, default_strict=default_strict)
+    inner = When(mocker, parent=outer.mocked_calls)
+    outer(*target, strict=outer_strict).called_with(1).then_return("Outer")
+    inner(*target, strict=inner_strict).called_with(2).then_return("Inner")
+
+    if fails:
+        with pytest.raises(
+            UnmatchedCallError,
+            match=r"doesn't match any of 2 mocked calls:\n.*2.*\n.*1",
+        ):
+            example_module.some_foo_with_variadic_args_kwargs(3)
+    else:
+        assert example_module.some_foo_with_variadic_args_kwargs(3) == (
+            "Not mocked"
+        )
+
+
+class AsyncKlass:
+    async def some_method(self, arg: int) -> str:
+        return "Not mocked"
+
+
+def test_should_work_with_coroutine_functions(either_when):
+    when_ = either_when
+    when_(AsyncKlass, "some_method").called_with(1).then_return("Mocked")
+    when_(example_module, "some_async_foo").called_with(1).then_call(
+        functools.partial(asyncio.sleep, 0, "Awaited")
+    )
+    when_(example_module, "some_async_foo").called_with(2).then_raise(
+        ValueError("Raised")
+    )
+
+    async def time_out() -> str:
+        await asyncio.sleep(0)
+        raise TimeoutError
+
+    when_(example_module, "some_async_foo").called_with(4).then_call(time_out)
+
+    async def main() -> list[str]:
+        return [
+            await AsyncKlass().some_method(1),
+            await AsyncKlass().some_method(2),
+            await example_module.some_async_foo(1),
+            await example_module.some_async_foo(3),
+        ]
+
+    assert asyncio.run(main()) == [
+        "Mocked",
+        "Not mocked",
+        "Awaited",
+        "Not mocked",
+    ]
+    with pytest.raises(ValueError, match="Raised"):
+        asyncio.run(example_module.some_async_foo(2))
+    with pytest.raises(TimeoutError):
+        asyncio.run(example_module.some_async_foo(4))
+
+
+def test_strict_should_work_with_coroutine_functions(either_when):
+    when_ = either_when
+    when_(example_module, "some_async_foo", strict=True).called_with(
+        1
+    ).then_return("Mocked")
+
+    with pytest.raises(UnmatchedCallError):
+        asyncio.run(example_module.some_async_foo(2))
+
+
+def test_then_return_after_should_not_block_the_event_loop(when):
+    delay = 0.1
+    when(example_module, "some_async_foo").called_with(
+        when.markers.any
+    ).then_return_after("Mocked", delay)
+
+    async def main() -> list[str]:
+        return await asyncio.gather(
+            *(example_module.some_async_foo(arg) for arg in range(10))
+        )
+
+    started = time.perf_counter()
+    assert asyncio.run(main()) == ["Mocked"] * 10
+    assert time.perf_counter() - started < delay * 5
+
+
+def test_then_return_after_should_sleep_in_functions(when):
+    delay = 0.01
+    when(
+        example_module, "some_foo_without_args"
+    ).called_with().then_return_after("Mocked", delay)
+
+    started = time.perf_counter()
+    assert example_module.some_foo_without_args() == "Mocked"
+    assert time.perf_counter() - started >= delay
+
+
+def test_called_with_table_should_mock_every_row(when):
+    patched_klass = when(Klass1, "some_method").called_with_table(
+        ((arg1, 1), {"kwarg1": "b", "kwarg2": "c"}, f"Mocked {arg1}")
+        for arg1 in "abc"
+    )
+
+    assert [
+        Klass1().some_method(arg1, 1, kwarg1="b", kwarg2="c")
+        for arg1 in "abcd"
+    ] == ["Mocked a", "Mocked b", "Mocked c", "Not mocked"]
+    assert (
+        when(Klass1, "some_method")
+        .called_with("d", 1, kwarg1="b", kwarg2="c")
+        .then_return("Mocked d")
+        is patched_klass
+    )
+    assert Klass1().some_method("d", 1, kwarg1="b", kwarg2="c") == "Mocked d"
+
+
+def test_called_with_table_should_register_all_rows_or_none(when):
+    with pytest.raises(TypeError):
+        when(example_module, "some_normal_function").called_with_table(
+            [
+                (("a", 1), {"kwarg1": "b", "kwarg2": "c"}, "Mocked"),
+                (("a", 1, 2), {"kwarg1": "b", "kwarg2": "c"}, "Mocked"),
+            ]
+        )
+
+    assert when.mocked_calls.size == 0
+    assert (
+        example_module.some_normal_function("a", 1, kwarg1="b", kwarg2="c")
+        == "Not mocked"
+    )
+
+
+def test_then_return_many_should_consume_values_lazily(when):
+    consumed = []
+
+    def pages():
+        for number in range(3):
+            consumed.append(number)
+            yield f"page {number}"
+
+    when(
+        example_module, "some_foo_without_args"
+    ).called_with().then_return_many(pages())
+
+    assert consumed == []
+    assert example_module.some_foo_without_args() == "page 0"
+    assert consumed == [0]
+    assert [example_module.some_foo_without_args() for _ in range(2)] == [
+        "page 1",
+        "page 2",
+    ]
+    with pytest.raises(ResponsesExhaustedError):
+        example_module.some_foo_without_args()
+
+
+def test_then_return_many_should_repeat_the_last_value(when):
+    when(example_module, "some_foo_with_variadic_args_kwargs").called_with(
+        1
+    ).then_return_many("ab", on_exhausted=when.exhausted.repeat_last)
+    when(example_module, "some_foo_with_variadic_args_kwargs").called_with(
+        2
+    ).then_return_many([], on_exhausted=when.exhausted.repeat_last)
+
+    assert [
+        example_module.some_foo_with_variadic_args_kwargs(1) for _ in range(4)
+    ] == ["a", "b", "b", "b"]
+    with pytest.raises(ResponsesExhaustedError):
+        example_module.some_foo_with_variadic_args_kwargs(2)
+
+
+def test_then_return_many_should_fall_through(either_when):
+    when_ = either_when
+    when_(
+        example_module, "some_foo_without_args"
+    ).called_with().then_return_many(
+        ["Mocked"], on_exhausted=when_.exhausted.fall_through
+    )
+    when_(example_module, "some_async_foo").called_with(1).then_return_many(
+        ["Mocked"], on_exhausted=when_.exhausted.fall_through
+    )
+    when_(example_module, "some_normal_function", strict=True).called_with(
+        "a", 1, kwarg1="b", kwarg2="c"
+    ).then_return_many([], on_exhausted=when_.exhausted.fall_through)
+
+    assert [example_module.some_foo_without_args() for _ in range(2)] == [
+        "Mocked",
+        "Not mocked",
+    ]
+    assert [
+        asyncio.run(example_module.some_async_foo(1)) for _ in range(2)
+    ] == ["Mocked", "Not mocked"]
+    with pytest.raises(UnmatchedCallError):
+        example_module.some_normal_function("a", 1, kwarg1="b", kwarg2="c")
+    stats = when_.mocked_calls.mocked_calls_registry[
+        when_.mocked_calls.get_target_key(
+            example_module, "some_foo_without_args"
+        )
+    ].stats
+    assert (stats.calls, stats.misses, stats.fallthroughs) == (2, 1, 1)
+    assert [
+        (stub.matches, stub.fallthroughs, stub.misses)
+        for stub in stats.stubs.values()
+    ] == [(1, 1, 0)]
+
+
+def test_fall_through_should_match_the_next_mocked_calls(either_when):
+    when_ = either_when
+    when_(example_module, "some_foo_with_variadic_args_kwargs").called_with(
+        1
+    ).then_return_many([1], on_exhausted=when_.exhausted.fall_through)
+    when_(example_module, "some_foo_with_variadic_args_kwargs").called_with(
+        when_.markers.any
+    ).then_return("Wildcard")
+    when_(example_module, "some_async_foo").called_with(1).then_return_many(
+        [1], on_exhausted=when_.exhausted.fall_through
+    )
+    when_(example_module, "some_async_foo").called_with(
+        when_.markers.any
+    ).then_return("Wildcard")
+
+    assert [
+        example_module.some_foo_with_variadic_args_kwargs(1) for _ in range(2)
+    ] == [1, "Wildcard"]
+    assert [
+        asyncio.run(example_module.some_async_foo(1)) for _ in range(2)
+    ] == [1, "Wildcard"]
+    stats = when_.mocked_calls.mocked_calls_registry[
+        when_.mocked_calls.get_target_key(example_module, "some_async_foo")
+    ].stats
+    assert (stats.calls, stats.misses, stats.fallthroughs) == (2, 0, 0)
+    assert [
+        (stub.matches, stub.fallthroughs, stub.misses)
+        for stub in stats.stubs.values()
+    ] == [(1, 1, 0), (1, 0, 1)]
+
+
+def test_fall_through_should_match_the_mocked_calls_below_the_layer(mocker):
+    parent = When(mocker)
+    child = When(mocker, parent=parent.mocked_calls)
+    target = (example_module, "some_foo_with_variadic_args_kwargs")
+    parent(*target).called_with(1).then_return("Parent")
+    for arg, value in ((1, "Child 1"), (child.markers.any, "Child any")):
+        child(*target).called_with(arg).then_return_many(
+            [value], on_exhausted=child.exhausted.fall_through
+        )
+
+    assert [
+        example_module.some_foo_with_variadic_args_kwargs(1) for _ in range(3)
+    ] == ["Child 1", "Child any", "Parent"]
+
+
+def test_then_cycle_should_repeat_the_values(when):
+    when(example_module, "some_foo_without_args").called_with().then_cycle(
+        iter("ab")
+    )
+
+    assert [example_module.some_foo_without_args() for _ in range(5)] == list(
+        "ababa"
+    )
+
+
+def test_then_answer_should_get_the_bound_call(either_when):
+    when_ = either_when
+    when_(Klass1, "some_method_with_defaults").called_with(
+        "a",
+        when_.markers.any,
+        kwarg1="b",
+    ).then_answer(
+        lambda call: (
+            type(call.arguments["self"]).__name__,
+            call.arguments["arg2"] * 2,
+            call.arguments["kwarg2"],
+        )
+    )
+    when_(example_module, "some_async_foo").called_with(
+        when_.markers.any
+    ).then_answer(
+        lambda call: asyncio.sleep(0, f"Mocked {call.arguments['arg']}")
+    )
+
+    assert Klass1().some_method_with_defaults("a", 21, kwarg1="b") == (
+        "Klass1",
+        42,
+        "some default string",
+    )
+    assert Klass1().some_method_with_defaults("b", 21, kwarg1="b") == (
+        "Not mocked"
+    )
+    assert asyncio.run(example_module.some_async_foo(42)) == "Mocked 42"
+
+
+def test_should_match_arguments_with_matchers(when):
+    markers = when.markers
+    when(example_module, "some_normal_function").called_with(
+        markers.matches(r"^user-\d+$"),
+        markers.between(1, 10),
+        kwarg1=markers.instance_of(list, dict),
+        kwarg2=markers.satisfies(str.isupper),
+    ).then_return("Mocked")
+
+    assert [
+        example_module.some_normal_function(*args, **kwargs)
+        for args, kwargs in [
+            (("user-1", 1), {"kwarg1": [1], "kwarg2": "A"}),
+            (("user-2", 10), {"kwarg1": {"a": 1}, "kwarg2": "B"}),
+            (("user-x", 1), {"kwarg1": [1], "kwarg2": "A"}),
+            (("user-1", 11), {"kwarg1": [1], "kwarg2": "A"}),
+            (("user-1", "1"), {"kwarg1": [1], "kwarg2": "A"}),
+            ((1, 1), {"kwarg1": [1], "kwarg2": "A"}),
+            (("user-1", 1), {"kwarg1": (1,), "kwarg2": "A"}),
+            (("user-1", 1), {"kwarg1": [1], "kwarg2": "a"}),
+        ]
+    ] == ["Mocked"] * 2 + ["Not mocked"] * 6
+
+
+def test_should_check_cheap_matchers_first(when):
+    checked = []
+
+    def expensive(value):
+        checked.append(value)
+        return True
+
+    when(example_module, "some_normal_function").called_with(
+        when.markers.satisfies(expensive),
+        when.markers.instance_of(int),
+        kwarg1="b",
+        kwarg2=when.markers.any,
+    ).then_return("Mocked")
+
+    assert (
+        example_module.some_normal_function("a", "1", kwarg1="b", kwarg2="c")
+        == "Not mocked"
+    )
+    assert (
+        example_module.some_normal_function("a", 1, kwarg1="c", kwarg2="c")
+        == "Not mocked"
+    )
+    assert checked == []
+    assert (
+        example_module.some_normal_function("a", 1, kwarg1="b", kwarg2="c")
+        == "Mocked"
+    )
+    assert checked == ["a"]
+
+
+def test_should_match_arguments_by_identity_and_content(when):
+    payload = {"rows": [[1, 2], [3, 4]]}
+    when(example_module, "some_normal_function").called_with(
+        when.markers.same(payload),
+        when.markers.same_content(bytearray(b"content")),
+        kwarg1=when.markers.same_content(payload),
+        kwarg2=when.markers.any,
+    ).then_return("Mocked")
+
+    assert [
+        example_module.some_normal_function(*args, kwarg1=kwarg1, kwarg2="c")
+        for args, kwarg1 in [
+            ((payload, b"content"), payload),
+            ((payload, bytearray(b"content")), {"rows": [[1, 2], [3, 4]]}),
+            ((payload, memoryview(b"_c_o_n_t_e_n_t")[1::2]), payload),
+            (({"rows": [[1, 2], [3, 4]]}, b"content"), payload),
+            ((payload, b"other"), payload),
+            ((payload, b"content"), {"rows": [[1, 2]]}),
+            ((payload, b"content"), lambda: None),
+        ]
+    ] == ["Mocked"] * 3 + ["Not mocked"] * 4
+
+
+def test_same_content_should_digest_every_argument_once(when):
+    digested = []
+
+    def digest(value):
+        digested.append(value)
+        return len(value)
+
+    when(example_module, "some_normal_function").called_with(
+        when.markers.same_content("abc", digest),
+        when.markers.any,
+        kwarg1=when.markers.any,
+        kwarg2=when.markers.any,
+    ).then_return("Mocked")
+    argument = "xyz"
+
+    for _ in range(3):
+        assert (
+            example_module.some_normal_function(
+                argument, 1, kwarg1="a", kwarg2="b"
+            )
+            == "Mocked"
+        )
+    assert digested == ["abc", "xyz"]
+    assert (
+        example_module.some_normal_function("xy", 1, kwarg1="a", kwarg2="b")
+        == "Not mocked"
+    )
+    assert digested == ["abc", "xyz", "xy"]
+
+
+def test_should_log_calls_compactly(mocker):
+    when_ = When(mocker, call_log=4)
+    patched = (
+        when_(Klass1, "some_method")
+        .called_with("a", when_.markers.any, kwarg1="b", kwarg2="c")
+        .then_return("Mocked")
+    )
+    when_(Klass1, "some_method").called_with(
+        "b", 1, kwarg1="b", kwarg2="c"
+    ).then_return("Mocked b")
+    unhashable = bytearray(b"a")
+    calls = [("x", 0), ("a", 1), ("a", 2), ("b", 1), ("c", 3)]
+    for arg1, arg2 in calls:
+        Klass1().some_method(arg1, arg2, kwarg1="b", kwarg2="c")
+    Klass1().some_method("a", unhashable, kwarg1="b", kwarg2="c")
+    call_log = patched.when_call_log
+
+    assert patched.call_args_list == patched.mock_calls == []
+    assert {
+        "calls": patched.call_count,
+        "logged": call_log.logged,
+        "retained": len(call_log),
+        "dropped": call_log.dropped,
+        "misses": call_log.misses,
+    } == {
+        "calls": 6,
+        "logged": 6,
+        "retained": 4,
+        "dropped": 2,
+        "misses": 1,
+    }
+    assert [
+        call_log.count(*args, kwarg1="b", kwarg2="c")
+        for args in [
+            ("a", when_.markers.any),
+            ("a", 1),
+            ("a", 2),
+            ("a", unhashable),
+            ("a", bytearray(b"a")),
+        ]
+    ] == [2, 0, 1, 1, 0]
+    assert [
+        call_log.count_matched_by(*args, kwarg1="b", kwarg2="c")
+        for args in [("a", when_.markers.any), ("b", 1), ("c", 3)]
+    ] == [2, 1, 0]
+
+
+def test_should_log_calls_by_exact_fingerprints(mocker):
+    when_ = When(mocker, call_log=10)
+    patched = (
+        when_(example_module, "some_foo_with_variadic_args_kwargs")
+        .called_with(when_.markers.any, a=1)
+        .then_return("Mocked")
+    )
+    large = 2**61 - 1
+    for args, kwargs in [
+        ((-1,), {"a": 1, "b": 2}),
+        ((-2,), {"b": 2, "a": 1}),
+        ((1, large + 1), {"a": 1.0}),
+        (("x",), {"a": "1", "c": [1, (2, "3")]}),
+        ((b"x", 0.5), {"a": None}),
+    ]:
+        example_module.some_foo_with_variadic_args_kwargs(*args, **kwargs)
+    call_log = patched.when_call_log
+    any_ = when_.markers.any
+
+    assert [
+        call_log.count(*args, **kwargs)
+        for args, kwargs in [
+            ((-1,), {"a": 1, "b": 2}),
+            ((-1,), {"b": 2, "a": 1}),
+            ((-2,), {"a": 1}),
+            ((-2,), {"a": 1, "b": any_}),
+            ((-2,), {"a": 2}),
+            ((-2,), {"c": any_}),
+            ((1, 2), {"a": 1}),
+            ((1, large + 1), {"a": 1}),
+            (("x",), {"a": "1", "c": [1, (2, "3")]}),
+            (("x",), {"a": "1", "c": [1, (2, 3)]}),
+            ((b"x", 0.5), {"a": None}),
+            ((b"x", 0.25), {"a": None}),
+            ((-2,), {"d": 1}),
+        ]
+    ] == [1, 1, 1, 1, 0, 0, 0, 1, 1, 0, 1, 0, 0]
+    when_.verify(
+        example_module, "some_foo_with_variadic_args_kwargs"
+    ).called_with(-2, b=any_, a=1).times(1)
+
+
+def test_should_log_calls_of_coroutine_functions(mocker):
+    when_ = When(mocker, call_log=2)
+    patched = (
+        when_(example_module, "some_async_foo")
+        .called_with(1)
+        .then_return("Mocked")
+    )
+
+    assert [
+        asyncio.run(example_module.some_async_foo(arg)) for arg in (1, 2)
+    ] == ["Mocked", "Not mocked"]
+    assert patched.await_args_list == []
+    assert (
+        patched.when_call_log.count(1),
+        patched.when_call_log.misses,
+    ) == (
+        1,
+        1,
+    )
+
+
+def test_should_verify_calls_by_mocked_call_counters(when, mocker):
+    markers = when.markers
+    when(Klass1, "some_method").called_with(
+        "a", markers.any, kwarg1="b", kwarg2="c"
+    ).then_return_many(["Mocked"], on_exhausted=when.exhausted.fall_through)
+    patched = (
+        when(Klass1, "some_method")
+        .called_with("b", 1, kwarg1="b", kwarg2="c")
+        .then_return("Mocked b")
+    )
+    for arg1, arg2 in [("a", 1), ("a", 2), ("b", 1), ("c", 1)]:
+        Klass1().some_method(arg1, arg2, kwarg1="b", kwarg2="c")
+    # the counters are used, the calls recorded by the mock are not needed
+    mocker.patch.object(patched.mock, "call_args_list", [])
+    verify = when.verify(Klass1, "some_method")
+
+    verify.called_with("a", markers.any, kwarg1="b", kwarg2="c").times(2)
+    verify.called_with("a", markers.any, kwarg1="b", kwarg2="c").at_least(1)
+    verify.called_with("b", 1, kwarg1="b", kwarg2="c").times(1)
+    with pytest.raises(
+        AssertionError,
+        match=re.escape("Expected 3 calls of test_integration.Klass1"),
+    ):
+        verify.called_with("a", markers.any, kwarg1="b", kwarg2="c").times(3)
+    with pytest.raises(AssertionError, match="Expected at least 2 calls"):
+        verify.called_with("b", 1, kwarg1="b", kwarg2="c").at_least(2)
+
+
+def test_should_verify_shadowed_calls_by_the_recorded_calls(when):
+    markers = when.markers
+    when(Klass1, "some_method").called_with(
+        "a", markers.any, kwarg1="b", kwarg2="c"
+    ).then_return("Any")
+    when(Klass1, "some_method").called_with(
+        "a", 2, kwarg1="b", kwarg2="c"
+    ).then_return("Exact")
+    results = [Klass1().some_method("b", 1, kwarg1="b", kwarg2="c")]
+    when(Klass1, "some_method").called_with(
+        "b", 1, kwarg1="b", kwarg2="c"
+    ).then_return("Late")
+    results.extend(
+        Klass1().some_method(arg1, arg2, kwarg1="b", kwarg2="c")
+        for arg1, arg2 in [("a", 2), ("a", 2), ("b", 1)]
+    )
+    verify = when.verify(Klass1, "some_method")
+
+    assert results == ["Not mocked", "Any", "Any", "Late"]
+    verify.called_with("a", 2, kwarg1="b", kwarg2="c").times(2)
+    verify.called_with("b", 1, kwarg1="b", kwarg2="c").times(2)
+    verify.called_with("a", markers.any, kwarg1="b", kwarg2="c").times(2)
+
+
+def test_should_verify_calls_not_mocked_by_the_recorded_calls(when):
+    markers = when.markers
+    when(Klass1, "some_method").called_with(
+        "a", markers.any, kwarg1="b", kwarg2="c"
+    ).then_return("Mocked")
+    for arg1, arg2 in [("a", 1), ("a", 2), ("b", 1), ("c", "1")]:
+        Klass1().some_method(arg1, arg2, kwarg1="b", kwarg2="c")
+    verify = when.verify(Klass1, "some_method")
+
+    verify.called_with("a", 2, kwarg1="b", kwarg2="c").times(1)
+    verify.called_with(
+        markers.any, markers.instance_of(int), kwarg1="b", kwarg2="c"
+    ).times(3)
+    verify.called_with("d", markers.any, kwarg1="b", kwarg2="c").never()
+    with pytest.raises(ValueError, match="is not patched by when"):
+        when.verify(Klass1, "some_method_with_defaults").called_with(
+            "a", 1, kwarg1="b"
+        ).never()
+
+
+def test_should_verify_calls_of_all_the_layers(mocker):
+    parent = When(mocker)
+    child = When(mocker, parent=parent.mocked_calls)
+    for when_ in (parent, child):
+        when_(example_module, "some_normal_function").called_with(
+            "a", 1, kwarg1="b", kwarg2="c"
+        ).then_return("Mocked")
+        example_module.some_normal_function("a", 1, kwarg1="b", kwarg2="c")
+
+    child.verify(example_module, "some_normal_function").called_with(
+        "a", 1, kwarg1="b", kwarg2="c"
+    ).times(2)
+
+
+@pytest.mark.parametrize("call_log", [None, 10])
+def test_should_verify_calls_of_the_outer_scopes_since_the_setup(
+    mocker, call_log
+):
+    parent = When(mocker, call_log=call_log)
+    parent(example_module, "some_normal_function").called_with(
+        "a", 1, kwarg1="b", kwarg2="c"
+    ).then_return("Mocked")
+    for _ in range(2):
+        example_module.some_normal_function("a", 1, kwarg1="b", kwarg2="c")
+    child = When(mocker, parent=parent.mocked_calls)
+    child(example_module, "some_normal_function").called_with(
+        "b", 1, kwarg1="b", kwarg2="c"
+    ).then_return("Child")
+
+    example_module.some_normal_function("a", 1, kwarg1="b", kwarg2="c")
+
+    verify = child.verify(example_module, "some_normal_function")
+    verify.called_with("a", 1, kwarg1="b", kwarg2="c").times(1)
+    verify.called_with("b", 1, kwarg1="b", kwarg2="c").never()
+
+
+def test_should_verify_calls_logged_by_the_call_log(mocker):
+    when_ = When(mocker, call_log=10)
+    when_(example_module, "some_normal_function").called_with(
+        "a", when_.markers.any, kwarg1="b", kwarg2="c"
+    ).then_return("Mocked")
+    for arg2 in (1, 2, 2):
+        example_module.some_normal_function("a", arg2, kwarg1="b", kwarg2="c")
+    verify = when_.verify(example_module, "some_normal_function")
+
+    verify.called_with("a", 2, kwarg1="b", kwarg2="c").times(2)
+    verify.called_with(
+        when_.markers.any, 1, kwarg1="b", kwarg2=when_.markers.any
+    ).times(1)
+    with pytest.raises(ValueError, match="matched by the values"):
+        verify.called_with(
+            "a", when_.markers.instance_of(int), kwarg1="b", kwarg2="c"
+        ).never()
+
+
+def test_should_count_the_misses_of_layers_since_registration(mocker):
+    parent = When(mocker)
+    child = When(mocker, parent=parent.mocked_calls)
+    parent(example_module, "some_foo_with_variadic_args_kwargs").called_with(
+        1
+    ).then_return("Parent")
+    example_module.some_foo_with_variadic_args_kwargs(1)
+    child(example_module, "some_foo_with_variadic_args_kwargs").called_with(
+        2
+    ).then_return("Child")
+    for arg in (1, 2, 3):
+        example_module.some_foo_with_variadic_args_kwargs(arg)
+
+    stubs = [
+        stub
+        for when_ in (parent, child)
+        for mocked_calls in when_.mocked_calls.mocked_calls_registry.values()
+        for stub in mocked_calls.stats.stubs.values()
+    ]
+    assert [(stub.matches, stub.misses) for stub in stubs] == [(2, 2), (1, 2)]
+
+
+def test_should_layer_mocked_calls_on_the_parent(mocker):
+    parent = When(mocker)
+    child = When(mocker, parent=parent.mocked_calls)
+    parent_mock = (
+        parent(example_module, "some_async_foo")
+        .called_with(1)
+        .then_return("Parent")
+    )
+    child_mock = (
+        child(example_module, "some_async_foo")
+        .called_with(2)
+        .then_return_after("Child", 0)
+    )
+    assert child_mock is parent_mock
+    assert asyncio.run(example_module.some_async_foo(1)) == "Parent"
+    assert asyncio.run(example_module.some_async_foo(2)) == "Child"
+
+    child.mocked_calls.clear()
+
+    assert example_module.some_async_foo is parent_mock
+    assert asyncio.run(example_module.some_async_foo(2)) == "Not mocked"
+
+    parent.mocked_calls.clear()
+
+    assert asyncio.run(example_module.some_async_foo(1)) == "Not mocked"
+
+
+def test_should_reset_the_history_of_the_parent_mocks(mocker):
+    parent = When(mocker, call_log=10)
+    patched = (
+        parent(example_module, "some_foo_with_variadic_args_kwargs")
+        .called_with(1)
+        .then_return("Parent")
+    )
+    for _ in range(3):
+        example_module.some_foo_with_variadic_args_kwargs(1)
+
+    child = When(mocker, parent=parent.mocked_calls)
+
+    assert [patched.call_count, len(patched.when_call_log)] == [0, 0]
+    assert example_module.some_foo_with_variadic_args_kwargs(1) == "Parent"
+    patched.assert_called_once()
+    assert patched.when_call_log.count(1) == 1
+
+    child.mocked_calls.clear()
+
+    assert [patched.call_count, len(patched.when_call_log)] == [0, 0]
+
+
+@pytest.mark.parametrize(
+    ("target", "name"),
+    [
+        (example_module, "tests.resources.example_module.some_foo"),
+        (Klass1, "test_integration.Klass1.some_foo"),
+        (Klass1(), "test_integration.Klass1.some_foo (instance)"),
+    ],
+)
+def test_should_name_targets(target, name):
+    assert get_target_name(target, "some_foo") == name
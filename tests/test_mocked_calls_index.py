@@ -0,0 +1,538 @@
+import concurrent.futures
+import inspect
+import re
+import threading
+
+import pytest
+
+from pytest_when.matchers import MAX_CACHED_DIGESTS
+from pytest_when.when import (
+    FIRST_REORDER,
+    MAX_DESCRIBED_MOCKED_CALLS,
+    NOT_MATCHED,
+    CallMatcher,
+    Markers,
+    MockedCallsIndex,
+    UnmatchedCallError,
+    create_call_key,
+    get_mocked_call_result,
+    get_stub_id,
+    get_var_keyword,
+    side_effect_factory,
+)
+
+
+def foo(a_arg, b_arg, *, c_kw, d_kw="d_kw default"): ...
+
+
+SIGNATURE = inspect.signature(foo)
+
+
+class Unhashable:
+    __hash__ = None  # type: ignore
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return other == self.value
+
+
+def build_index(*call_keys: tuple) -> MockedCallsIndex:
+    index = MockedCallsIndex(SIGNATURE)
+    for position, (args, kwargs) in enumerate(call_keys):
+        index[create_call_key(SIGNATURE, *args, **kwargs)] = (
+            lambda p=position: f"stub {p}"
+        )
+    return index
+
+
+def find(index: MockedCallsIndex, *args, **kwargs):
+    found = index.find(SIGNATURE.bind(*args, **kwargs))
+    return None if found is None else found.lazy_value()
+
+
+def test_should_find_exact_call_keys_by_values():
+    index = build_index(
+        *(((a_arg, 1), {"c_kw": 2}) for a_arg in range(100)),
+    )
+    assert find(index, 42, 1, c_kw=2) == "stub 42"
+    assert find(index, 42, 2, c_kw=2) is None
+    assert index.fallback == ()
+
+
+def test_first_registered_call_key_should_win():
+    index = build_index(
+        ((1, Markers.any), {"c_kw": 2}),
+        ((1, 1), {"c_kw": 2}),
+        ((2, 1), {"c_kw": 2}),
+        ((Markers.any, 1), {"c_kw": Markers.any}),
+    )
+    assert find(index, 1, 1, c_kw=2) == "stub 0"
+    assert find(index, 2, 1, c_kw=2) == "stub 2"
+    assert find(index, 3, 1, c_kw=3) == "stub 3"
+    assert find(index, 3, 2, c_kw=3) is None
+
+
+def test_should_match_call_keys_without_default_params():
+    index = build_index(
+        ((1, 1), {"c_kw": 2, "d_kw": 3}),
+        ((1, 1), {"c_kw": 2}),
+    )
+    assert find(index, 1, 1, c_kw=2, d_kw=3) == "stub 0"
+    assert find(index, 1, 1, c_kw=2, d_kw=4) == "stub 1"
+    assert find(index, 1, 1, c_kw=2) == "stub 1"
+
+
+def test_should_not_match_call_missing_a_wildcard_param():
+    index = build_index(
+        ((1, 1), {"c_kw": 2, "d_kw": Markers.any}),
+    )
+    assert find(index, 1, 1, c_kw=2, d_kw=3) == "stub 0"
+    assert find(index, 1, 1, c_kw=2) is None
+
+
+def test_should_match_nested_containers_with_markers():
+    index = build_index(
+        (([1, Markers.any], {"a": Markers.any}), {"c_kw": 2}),
+        (([1, 2], {"a": 1}), {"c_kw": 2}),
+    )
+    assert find(index, [1, 2], {"a": 1}, c_kw=2) == "stub 0"
+    assert find(index, [1, 3], {"a": 3}, c_kw=2) == "stub 0"
+    assert find(index, [1, 3, 4], {"a": 1}, c_kw=2) is None
+    assert find(index, 1, {"a": 1}, c_kw=2) is None
+
+
+def test_should_scan_all_call_keys_for_unhashable_values():
+    index = build_index(
+        ((1, 1), {"c_kw": 2}),
+        ((1, 2), {"c_kw": Markers.any}),
+    )
+    assert find(index, 1, Unhashable(1), c_kw=2) == "stub 0"
+    assert find(index, 1, Unhashable(2), c_kw=2) == "stub 1"
+    assert find(index, 1, Unhashable(3), c_kw=2) is None
+
+
+class Array:
+    """Compares elementwise, like numpy arrays, so its truth is ambiguous."""
+
+    __hash__ = None  # type: ignore
+
+    def __init__(self, *values):
+        self.values = values
+
+    def __eq__(self, other):
+        return Array(*(value == other for value in self.values))
+
+    def __ne__(self, other):
+        return Array(*(value != other for value in self.values))
+
+    def __bool__(self):
+        raise ValueError("The truth value of an array is ambiguous")
+
+
+def test_should_not_match_values_of_ambiguous_equality():
+    array = Array(1, 2)
+    index = build_index(
+        ((1, 1), {"c_kw": 2}),
+        ((1, (Markers.any, 1)), {"c_kw": 2}),
+        ((1, Markers.same(array)), {"c_kw": 2}),
+    )
+    assert find(index, 1, array, c_kw=2) == "stub 2"
+    assert find(index, 1, Array(1, 2), c_kw=2) is None
+    assert find(index, 1, [1, array], c_kw=2) is None
+
+
+def test_should_not_convert_params_matched_by_identity_only():
+    payload = {"rows": [list(range(10))] * 10}
+    index = build_index(
+        ((1, Markers.same(payload)), {"c_kw": 2}),
+        ((2, Markers.any), {"c_kw": 2}),
+    )
+    assert index.table.compared == {"a_arg", "c_kw"}
+    assert find(index, 1, payload, c_kw=2) == "stub 0"
+    assert find(index, 1, {"rows": [list(range(10))] * 10}, c_kw=2) is None
+
+
+def test_same_markers_should_be_equal_for_the_same_object():
+    payload = [1, 2]
+    index = build_index(((1, Markers.same(payload)), {"c_kw": 2}))
+    index[create_call_key(SIGNATURE, 1, Markers.same(payload), c_kw=2)] = (
+        lambda: "replaced"
+    )
+    assert len(index.matchers) == 1
+    assert Markers.same(payload) != Markers.same([1, 2])
+    assert Markers.same(payload) != payload
+
+
+def test_same_content_should_keep_last_digests_only():
+    same_content = Markers.same_content(0, abs)
+    arguments = [-value for value in range(MAX_CACHED_DIGESTS + 1)]
+    assert [same_content.matches(argument) for argument in arguments] == [
+        True,
+        *[False] * MAX_CACHED_DIGESTS,
+    ]
+    assert len(same_content.digests) == MAX_CACHED_DIGESTS
+    assert id(arguments[0]) not in same_content.digests
+
+
+def test_same_content_should_not_depend_on_the_order_of_the_items():
+    same_content = Markers.same_content([{"a": 1, "b": {2, "c"}}])
+    assert same_content.matches([{"b": {"c", 2}, "a": 1}])
+    assert not same_content.matches(({"b": {"c", 2}, "a": 1},))
+    assert not same_content.matches([{"a": 1, "b": {2}}])
+    # the distinct keys of the same pickle don't compare their values
+    assert Markers.same_content({float("nan"): 1, float("nan"): "a"})
+
+
+def build_adaptive_index(*call_keys: tuple, profile=None) -> MockedCallsIndex:
+    index = MockedCallsIndex(
+        SIGNATURE, profile={} if profile is None else profile
+    )
+    index.update(
+        (
+            create_call_key(SIGNATURE, *args, **kwargs),
+            lambda p=position: f"stub {p}",
+        )
+        for position, (args, kwargs) in enumerate(call_keys)
+    )
+    return index
+
+
+def match(index: MockedCallsIndex, *args, **kwargs):
+    found = index.match(SIGNATURE.bind(*args, **kwargs))
+    return None if found is None else found.lazy_value()
+
+
+def test_should_move_hit_disjoint_matchers_to_the_front():
+    index = build_adaptive_index(
+        *(((a_arg, Markers.any), {"c_kw": 2}) for a_arg in range(10)),
+    )
+    assert [matcher.position for matcher in index.table.hot] == list(range(10))
+    assert index.table.ordered == ()
+
+    for _ in range(FIRST_REORDER):
+        assert match(index, 9, 1, c_kw=2) == "stub 9"
+    assert [matcher.position for matcher in index.table.hot][:2] == [9, 0]
+
+    for _ in range(FIRST_REORDER - 1):
+        assert match(index, 8, 1, c_kw=2) == "stub 8"
+    assert match(index, 9, 1, c_kw=2) == "stub 9"
+    assert [matcher.position for matcher in index.table.hot][:3] == [9, 8, 0]
+    assert match(index, 9, 1, c_kw=3) is None
+
+
+def test_should_keep_first_match_of_overlapping_matchers():
+    index = build_adaptive_index(
+        ((1, 1), {"c_kw": 2}),
+        ((1, Markers.any), {"c_kw": 2}),
+        ((Markers.any, 1), {"c_kw": 2}),
+        ((2, Markers.any), {"c_kw": 2}),
+    )
+    assert [matcher.position for matcher in index.table.hot] == [1]
+    assert [matcher.position for matcher in index.table.ordered] == [2, 3]
+
+    for _ in range(FIRST_REORDER):
+        assert match(index, 2, 1, c_kw=2) == "stub 2"
+    assert [matcher.position for matcher in index.table.hot] == [1]
+    assert [match(index, a_arg, 1, c_kw=2) for a_arg in (1, 2, 3)] == [
+        "stub 0",
+        "stub 2",
+        "stub 2",
+    ]
+    assert match(index, 1, 2, c_kw=2) == "stub 1"
+    assert match(index, 2, 2, c_kw=2) == "stub 3"
+
+
+def get_call_key_stub_id(*args, **kwargs) -> str:
+    call_key = create_call_key(SIGNATURE, *args, **kwargs)
+    return get_stub_id(CallMatcher(call_key, None, 0, lambda: None))
+
+
+def test_should_order_matchers_by_hits_of_the_profile():
+    call_key = create_call_key(SIGNATURE, 2, Markers.any, c_kw=2)
+    index = build_adaptive_index(
+        *(((a_arg, Markers.any), {"c_kw": 2}) for a_arg in range(3)),
+        profile={get_call_key_stub_id(2, Markers.any, c_kw=2): 10},
+    )
+    assert [matcher.position for matcher in index.table.hot] == [2, 0, 1]
+    assert index.stub_ids[index.matchers[call_key]] == get_call_key_stub_id(
+        2, Markers.any, c_kw=2
+    )
+
+    index.clear()
+    assert index.stub_ids == {}
+    assert index.disjoint == set()
+
+
+class Payload:
+    """Argument with the default repr, containing its address."""
+
+
+def test_stub_id_should_not_depend_on_addresses_and_argument_matchers():
+    payload = {"items": list(range(100_000))}
+
+    assert get_call_key_stub_id(1, Payload(), c_kw=2) == get_call_key_stub_id(
+        1, Payload(), c_kw=2
+    )
+    assert get_call_key_stub_id(
+        1, Markers.same(payload), c_kw=2
+    ) == get_call_key_stub_id(1, Markers.same({"items": []}), c_kw=2)
+    assert get_call_key_stub_id(
+        1, Markers.satisfies(lambda _: True), c_kw=2
+    ) == get_call_key_stub_id(1, Markers.satisfies(bool), c_kw=2)
+    assert get_call_key_stub_id(1, 1, c_kw=2) != get_call_key_stub_id(
+        1, 2, c_kw=2
+    )
+    assert get_call_key_stub_id(
+        1, Markers.any, c_kw=2
+    ) != get_call_key_stub_id(1, payload, c_kw=2)
+
+
+def test_should_not_reorder_while_matchers_are_registered():
+    index = build_adaptive_index(
+        *(((a_arg, Markers.any), {"c_kw": 2}) for a_arg in range(2)),
+    )
+    table = index.table
+    with index.lock:
+        for _ in range(FIRST_REORDER):
+            assert match(index, 1, 1, c_kw=2) == "stub 1"
+    assert index.table is table
+
+
+class HashableArray(Array):
+    __hash__ = object.__hash__
+
+
+def test_matchers_of_ambiguous_equality_should_overlap():
+    index = build_adaptive_index(
+        ((Markers.any, HashableArray(1, 2)), {"c_kw": 2}),
+        ((Markers.any, HashableArray(1, 3)), {"c_kw": 2}),
+    )
+    assert [matcher.position for matcher in index.table.hot] == [0]
+
+
+def test_should_compile_call_key_into_matcher():
+    def foo_with_options(a_arg, b_arg, c_arg, **options): ...
+
+    signature = inspect.signature(foo_with_options)
+    matcher = CallMatcher(
+        create_call_key(
+            signature,
+            Markers.any,
+            [1, Markers.any],
+            (1, 2),
+            d_kw=Markers.any,
+            e_kw=3,
+        ),
+        get_var_keyword(signature),
+        0,
+        lambda: "Mocked",
+    )
+    assert matcher.params == ("a_arg", "b_arg", "c_arg", "d_kw", "e_kw")
+    assert matcher.wildcards == ("a_arg", "d_kw")
+    assert matcher.fixed == (("c_arg", (1, 2)), ("e_kw", 3))
+    assert matcher.nested == (("b_arg", (1, Markers.any)),)
+    assert not matcher.is_exact
+
+
+def test_should_replace_lazy_value_of_registered_call_key():
+    index = build_index(
+        ((1, Markers.any), {"c_kw": 2}),
+        ((1, 1), {"c_kw": 2}),
+    )
+    index[create_call_key(SIGNATURE, 1, 1, c_kw=2)] = lambda: "replaced"
+    index[create_call_key(SIGNATURE, 1, Markers.any, c_kw=2)] = (
+        lambda: "replaced wildcard"
+    )
+    assert find(index, 1, 1, c_kw=2) == "replaced wildcard"
+    assert find(index, 1, 2, c_kw=2) == "replaced wildcard"
+    assert [matcher.position for matcher in index.matchers.values()] == [0, 1]
+
+
+def test_should_return_sentinel_for_not_matched_calls():
+    index = build_index(((1, 1), {"c_kw": 2}))
+    assert get_mocked_call_result(SIGNATURE, index, 1, 1, c_kw=2) == "stub 0"
+    assert get_mocked_call_result(SIGNATURE, index, 1, 2, c_kw=2) is (
+        NOT_MATCHED
+    )
+
+
+def test_should_match_the_next_mocked_calls_of_fallen_through_calls():
+    index = build_index(
+        ((1, 1), {"c_kw": 2}),
+        ((1, Markers.any), {"c_kw": 2}),
+        ((Markers.any, 1), {"c_kw": 2}),
+    )
+    index[create_call_key(SIGNATURE, 1, 1, c_kw=2)] = lambda: NOT_MATCHED
+    index[create_call_key(SIGNATURE, 1, Markers.any, c_kw=2)] = (
+        lambda: NOT_MATCHED
+    )
+
+    assert get_mocked_call_result(SIGNATURE, index, 1, 1, c_kw=2) == "stub 2"
+    assert get_mocked_call_result(SIGNATURE, index, 1, 2, c_kw=2) is (
+        NOT_MATCHED
+    )
+    assert [matcher.calls for matcher in index.matchers.values()] == [1, 2, 1]
+
+
+def test_should_describe_unmatched_call_within_bounds():
+    index = build_index(
+        *(((a_arg, "x" * 1000), {"c_kw": Markers.any}) for a_arg in range(15)),
+    )
+    error = UnmatchedCallError(
+        create_call_key(SIGNATURE, "a", "y" * 1000, c_kw=2),
+        index,
+    )
+
+    lines = str(error).splitlines()
+
+    assert lines[0].startswith("Call (('a_arg', 'a'), ('b_arg', 'yyy")
+    assert lines[0].endswith("doesn't match any of 15 mocked calls:")
+    assert lines[1].startswith("  (('a_arg', 0), ('b_arg', 'xxx")
+    assert lines[-1] == "  ... and 5 more"
+    assert len(lines) == MAX_DESCRIBED_MOCKED_CALLS + 2
+    assert max(map(len, lines)) < len("x" * 1000)
+
+
+def test_strict_side_effect_should_raise_on_unmatched_calls():
+    index = build_index(((1, 1), {"c_kw": 2}))
+    index.strict = True
+    side_effect = side_effect_factory(
+        origin_callable=foo,
+        origin_callable_sig=SIGNATURE,
+        mocked_calls=index,
+    )
+    assert side_effect(1, 1, c_kw=2) == "stub 0"
+    with pytest.raises(
+        UnmatchedCallError,
+        match=re.escape("doesn't match any of 1 mocked calls"),
+    ):
+        side_effect(1, 2, c_kw=2)
+
+
+def test_update_should_publish_a_new_table():
+    index = build_index(((1, 1), {"c_kw": 2}))
+    table = index.table
+    index.update(
+        (
+            (create_call_key(SIGNATURE, 1, 1, c_kw=2), lambda: "updated"),
+            (create_call_key(SIGNATURE, 2, 1, c_kw=2), lambda: "added"),
+            (
+                create_call_key(SIGNATURE, Markers.any, 1, c_kw=3),
+                lambda: "any",
+            ),
+        )
+    )
+
+    assert index.table is not table
+    assert len(table.matchers) == 1
+    assert len(next(iter(table.exact.values()))) == 1
+    assert table.fallback == ()
+    assert find(index, 1, 1, c_kw=2) == "updated"
+    assert find(index, 2, 1, c_kw=2) == "added"
+    assert find(index, 3, 1, c_kw=3) == "any"
+    assert [len(matchers) for matchers in index.exact.values()] == [2]
+
+
+def test_update_should_publish_the_table_on_the_next_call():
+    index = build_adaptive_index(((1, Markers.any), {"c_kw": 2}))
+    index.update(
+        (create_call_key(SIGNATURE, value, Markers.any, c_kw=2), lambda: None)
+        for value in range(2, 4)
+    )
+    index[create_call_key(SIGNATURE, 4, 1, c_kw=2)] = lambda: "exact"
+    assert index.published is None
+
+    index.reorder()
+    assert index.published is None
+    assert match(index, 4, 1, c_kw=2) == "exact"
+    table = index.published
+    assert table is not None
+    assert [matcher.position for matcher in table.fallback] == [0, 1, 2]
+    assert match(index, 1, 1, c_kw=2) == "stub 0"
+    assert index.published is table
+
+
+def test_should_find_while_mocked_calls_are_added_concurrently():
+    mocked_calls = 500
+    index = MockedCallsIndex(SIGNATURE)
+    index[create_call_key(SIGNATURE, 0, 0, c_kw=0)] = lambda: "first"
+    stop = threading.Event()
+
+    def add_mocked_calls() -> None:
+        for value in range(1, mocked_calls):
+            index[create_call_key(SIGNATURE, value, Markers.any, c_kw=0)] = (
+                lambda: "added"
+            )
+        stop.set()
+
+    def call() -> set:
+        found = set()
+        while not stop.is_set():
+            found.add(find(index, 0, 0, c_kw=0))
+            found.add(find(index, 1, 0, c_kw=0) in (None, "added"))
+        return found
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+        callers = [executor.submit(call) for _ in range(4)]
+        executor.submit(add_mocked_calls).result()
+        assert all(caller.result() <= {"first", True} for caller in callers)
+    assert len(index.matchers) == mocked_calls
+
+
+def test_update_should_register_nothing_if_mocked_calls_raise():
+    index = build_index(((1, 1), {"c_kw": 2}))
+
+    def mocked_calls():
+        yield create_call_key(SIGNATURE, 1, 1, c_kw=2), lambda: "updated"
+        yield create_call_key(SIGNATURE, 2, 1, c_kw=2), lambda: "added"
+        yield create_call_key(SIGNATURE, 1, 1, 2, c_kw=2), lambda: "invalid"
+
+    with pytest.raises(TypeError):
+        index.update(mocked_calls())
+
+    assert find(index, 1, 1, c_kw=2) == "stub 0"
+    assert find(index, 2, 1, c_kw=2) is None
+    assert len(index.stats.stubs) == 1
+
+
+def test_should_order_argument_matchers_by_cost():
+    matcher = CallMatcher(
+        create_call_key(
+            SIGNATURE,
+            Markers.satisfies(bool),
+            Markers.matches("a"),
+            c_kw=Markers.between(1, 2),
+            d_kw=Markers.instance_of(int),
+        ),
+        None,
+        0,
+        lambda: None,
+    )
+    assert not matcher.is_exact
+    assert [name for name, _ in matcher.arguments] == [
+        "d_kw",
+        "c_kw",
+        "b_arg",
+        "a_arg",
+    ]
+
+
+@pytest.mark.parametrize(
+    ("argument_matcher", "value"),
+    [
+        (Markers.between(1, 2), "1"),
+        (Markers.matches("a"), 1),
+    ],
+)
+def test_argument_matchers_should_not_match_other_types(
+    argument_matcher, value
+):
+    assert not argument_matcher.matches(value)
+
+
+def test_argument_matchers_should_match_nested_values():
+    index = build_index(((1, [Markers.instance_of(int), 2]), {"c_kw": 2}))
+    assert find(index, 1, [1, 2], c_kw=2) == "stub 0"
+    assert find(index, 1, ["1", 2], c_kw=2) is None
@@ -0,0 +1,394 @@
+import types
+
+import pytest
+
+from pytest_when import plugin
+from pytest_when.stats import (
+    TargetStats,
+    registry_stats_key,
+    session_stats_key,
+    stub_profile_key,
+)
+from tests.resources import example_module
+
+
+TEST_MODULE = """
+class Klass:
+    def method(self, arg):
+        return "Not mocked"
+
+
+def test_one_mocked_call(when):
+    when(Klass, "method").called_with(1).then_return("Mocked")
+    assert Klass().method(1) == "Mocked"
+    assert Klass().method(2) == "Not mocked"
+
+
+def test_three_mocked_calls(when):
+    for arg in range(3):
+        when(Klass, "method").called_with(arg).then_return("Mocked")
+    assert Klass().method(2) == "Mocked"
+
+
+def test_registry_is_not_shared_between_tests(when):
+    assert when.mocked_calls.size == 0
+    assert Klass().method(1) == "Not mocked"
+"""
+
+
+def test_should_release_mocked_calls_on_clear(when):
+    when(example_module, "some_foo_without_args").called_with().then_return(
+        "Mocked"
+    )
+    (mocked_calls,) = when.mocked_calls.mocked_calls_registry.values()
+    assert when.mocked_calls.size == 1
+
+    when.mocked_calls.clear()
+
+    assert when.mocked_calls.size == 0
+    assert mocked_calls.matchers == {}
+    assert example_module.some_foo_without_args() == "Not mocked"
+
+
+def test_should_report_peak_registry_size(pytester: pytest.Pytester):
+    pytester.makepyfile(TEST_MODULE)
+    result = pytester.runpytest("--when-registry-stats")
+    result.assert_outcomes(passed=3)
+    result.stdout.fnmatch_lines(
+        [
+            "*pytest-when registry*",
+            "peak registry size: 3 mocked calls (*::test_three_mocked_calls)",
+        ]
+    )
+
+
+def test_should_not_report_registry_size_by_default(
+    pytester: pytest.Pytester,
+):
+    pytester.makepyfile(TEST_MODULE)
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=3)
+    result.stdout.no_fnmatch_line("*pytest-when registry*")
+
+
+def test_should_report_empty_registry(pytester: pytest.Pytester):
+    pytester.makepyfile("def test_without_when(): ...")
+    result = pytester.runpytest("--when-registry-stats")
+    result.assert_outcomes(passed=1)
+    result.stdout.fnmatch_lines(["peak registry size: 0 mocked calls"])
+
+
+def test_should_report_stats_of_patched_targets(pytester: pytest.Pytester):
+    pytester.makepyfile(TEST_MODULE)
+    result = pytester.runpytest("--when-stats")
+    result.assert_outcomes(passed=3)
+    result.stdout.fnmatch_lines(
+        [
+            "*pytest-when stats*",
+            "*calls*misses*fallthr*stubs*dead*target",
+            "*3*1*1*4*2*test_should_report_stats_of_patched_targets.Klass.method",
+            "calls passed to the original callable:",
+            "  *::test_one_mocked_call: *Klass.method x1",
+        ]
+    )
+
+
+def test_should_not_report_stats_without_fallthroughs(
+    pytester: pytest.Pytester,
+):
+    pytester.makepyfile("""
+        def foo():
+            return "Not mocked"
+
+
+        def test_mocked(when):
+            import test_should_not_report_stats_without_fallthroughs as module
+
+            when(module, "foo").called_with().then_return("Mocked")
+            assert module.foo() == "Mocked"
+        """)
+    result = pytester.runpytest("--when-stats")
+    result.assert_outcomes(passed=1)
+    result.stdout.fnmatch_lines(["*pytest-when stats*"])
+    result.stdout.no_fnmatch_line("calls passed to the original callable:")
+
+
+STRICT_TEST_MODULE = """
+import pytest
+
+from pytest_when.when import UnmatchedCallError
+
+
+class Klass:
+    def method(self, arg):
+        return "Not mocked"
+
+
+def test_default(when):
+    when(Klass, "method").called_with(1).then_return("Mocked")
+    with pytest.raises(UnmatchedCallError):
+        Klass().method(2)
+
+
+@pytest.mark.when_strict(False)
+def test_disabled_by_the_marker(when):
+    when(Klass, "method").called_with(1).then_return("Mocked")
+    assert Klass().method(2) == "Not mocked"
+"""
+
+
+def test_should_enable_strict_mode_by_the_ini_option(
+    pytester: pytest.Pytester,
+):
+    pytester.makeini("[pytest]\nwhen_strict = true\n")
+    pytester.makepyfile(STRICT_TEST_MODULE)
+    result = pytester.runpytest("--strict-markers")
+    result.assert_outcomes(passed=2)
+
+
+def make_worker(
+    pytester: pytest.Pytester,
+    worker_id: str,
+    calls: int,
+) -> types.SimpleNamespace:
+    config = pytester.parseconfigure("--when-stats", "--when-registry-stats")
+    config.workeroutput = {}  # type: ignore[attr-defined]
+    stats = TargetStats("module.foo")
+    stats.calls = stats.misses = stats.fallthroughs = calls
+    config.stash[session_stats_key].add(f"test_{worker_id}", [stats])
+    config.stash[registry_stats_key].update(calls, f"test_{worker_id}")
+    config.stash[stub_profile_key].add("module.foo", [("stub", calls)])
+    plugin.pytest_sessionfinish(types.SimpleNamespace(config=config))
+    return types.SimpleNamespace(
+        workerinput={"workerid": worker_id},
+        workeroutput=config.workeroutput,  # type: ignore[attr-defined]
+    )
+
+
+def test_should_merge_stats_of_xdist_workers(pytester: pytest.Pytester):
+    pytester.makeini("[pytest]\nwhen_adaptive = true\n")
+    config = pytester.parseconfigure("--when-stats", "--when-registry-stats")
+    for node in (
+        make_worker(pytester, "gw0", 1),
+        make_worker(pytester, "gw1", 2),
+        # crashed worker
+        types.SimpleNamespace(workerinput={"workerid": "gw2"}),
+    ):
+        node.config = config
+        plugin.pytest_testnodedown(node)
+
+    session_stats = config.stash[session_stats_key]
+    assert {
+        name: totals.calls for name, totals in session_stats.targets.items()
+    } == {"module.foo": 3}
+    assert {
+        worker_id: totals.calls
+        for worker_id, totals in session_stats.workers.items()
+    } == {"gw0": 1, "gw1": 2}
+    assert session_stats.fallthroughs == {
+        ("test_gw0", "module.foo"): 1,
+        ("test_gw1", "module.foo"): 2,
+    }
+    registry_stats = config.stash[registry_stats_key]
+    assert (registry_stats.peak_size, registry_stats.peak_nodeid) == (
+        2,
+        "test_gw1",
+    )
+    assert config.stash[stub_profile_key].hits == {"module.foo": {"stub": 3}}
+
+
+def test_should_report_stats_of_xdist_workers(pytester: pytest.Pytester):
+    pytest.importorskip("xdist")
+    pytester.makepyfile(TEST_MODULE)
+    result = pytester.runpytest(
+        "-n", "2", "--when-stats", "--when-registry-stats"
+    )
+    result.assert_outcomes(passed=3)
+    result.stdout.fnmatch_lines(
+        [
+            "peak registry size: 3 mocked calls (*::test_three_mocked_calls)",
+            "*pytest-when stats*",
+            "*3*1*1*4*2*test_should_report_stats_of_xdist_workers.Klass.method",
+            "per worker:",
+            "* gw[01]",
+            "calls passed to the original callable:",
+        ]
+    )
+
+
+SCOPED_TEST_MODULE = """
+import pytest
+
+from pytest_when.when import UnmatchedCallError
+
+
+class Klass:
+    def method(self, arg):
+        return "Not mocked"
+
+
+PATCHED = []
+
+
+@pytest.fixture(scope="module", autouse=True)
+def baseline(when_module):
+    PATCHED.append(
+        when_module(Klass, "method").called_with(1).then_return("Module")
+    )
+
+
+def test_baseline(when):
+    assert Klass().method(0) == "Session"
+    assert Klass().method(1) == "Module"
+    assert Klass().method(2) == "Not mocked"
+
+
+def test_override(when):
+    patched = when(Klass, "method").called_with(1).then_return("Test")
+    when(Klass, "method", strict=True).called_with(2).then_return("Test")
+    assert patched is PATCHED[0] is Klass.method
+    assert Klass().method(0) == "Session"
+    assert Klass().method(1) == "Test"
+    assert Klass().method(2) == "Test"
+    with pytest.raises(UnmatchedCallError):
+        Klass().method(3)
+
+
+def test_rolled_back():
+    assert PATCHED[0] is Klass.method
+    assert Klass().method(1) == "Module"
+    assert Klass().method(3) == "Not mocked"
+"""
+
+SCOPED_CONFTEST = """
+import pytest
+
+
+@pytest.fixture(scope="session", autouse=True)
+def session_baseline(when_session):
+    from test_should_layer_scoped_when_fixtures import Klass
+
+    when_session(Klass, "method").called_with(0).then_return("Session")
+"""
+
+
+def test_should_layer_scoped_when_fixtures(pytester: pytest.Pytester):
+    pytester.makeconftest(SCOPED_CONFTEST)
+    pytester.makepyfile(SCOPED_TEST_MODULE)
+    result = pytester.runpytest("--when-stats")
+    result.assert_outcomes(passed=3)
+    result.stdout.fnmatch_lines(
+        [
+            "*pytest-when stats*",
+            "       9        3        2      4      0 *.Klass.method",
+            "  <session>: *.Klass.method x2",
+        ]
+    )
+
+
+LATE_SESSION_TARGETS = """
+def target(arg):
+    return "orig"
+"""
+
+LATE_SESSION_TEST_MODULE = """
+import targets
+
+
+def test_module(when_module):
+    when_module(targets, "target").called_with(1).then_return("Module")
+    assert targets.target(1) == "Module"
+
+
+def test_session(when_session):
+    when_session(targets, "target").called_with(2).then_return("Session")
+    assert targets.target(1) == "Module"
+    assert targets.target(2) == "Session"
+"""
+
+LATE_SESSION_OTHER_TEST_MODULE = """
+import targets
+
+
+def test_session_stub():
+    assert targets.target(1) == "orig"
+    assert targets.target(2) == "Session"
+"""
+
+
+def test_should_layer_when_session_set_up_in_when_module(
+    pytester: pytest.Pytester,
+):
+    pytester.makepyfile(
+        targets=LATE_SESSION_TARGETS,
+        test_a=LATE_SESSION_TEST_MODULE,
+        test_b=LATE_SESSION_OTHER_TEST_MODULE,
+    )
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=3)
+
+
+CALL_LOG_TEST_MODULE = """
+class Klass:
+    def method(self, arg):
+        return "Not mocked"
+
+
+def test_call_log(when):
+    patched = when(Klass, "method").called_with(1).then_return("Mocked")
+    for arg in range(5):
+        Klass().method(arg)
+    assert patched.call_count == 5
+    assert patched.call_args_list == []
+    assert len(patched.when_call_log) == 3
+    assert patched.when_call_log.dropped == 2
+    assert patched.when_call_log.count(4) == 1
+"""
+
+
+def test_should_log_calls_by_the_ini_option(pytester: pytest.Pytester):
+    pytester.makeini("[pytest]\nwhen_call_log = 3\n")
+    pytester.makepyfile(CALL_LOG_TEST_MODULE)
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=1)
+
+
+ADAPTIVE_TEST_MODULE = """
+class Klass:
+    def method(self, arg, option):
+        return "Not mocked"
+
+
+def test_adaptive(when):
+    for arg in range(10):
+        when(Klass, "method").called_with(arg, when.markers.any).then_return(
+            arg
+        )
+    (mocked_calls,) = when.mocked_calls.mocked_calls_registry.values()
+    HOT.append([matcher.position for matcher in mocked_calls.table.hot][:2])
+    for _ in range({calls}):
+        assert Klass().method(9, None) == 9
+    assert Klass().method(8, None) == 8
+
+
+def test_hot_order():
+    assert HOT == [{expected}]
+"""
+
+
+def test_should_order_mocked_calls_by_hits_of_previous_session(
+    pytester: pytest.Pytester,
+):
+    pytester.makeini("[pytest]\nwhen_adaptive = true\n")
+    pytester.makepyfile(
+        "HOT = []\n" + ADAPTIVE_TEST_MODULE.format(calls=100, expected=[0, 1])
+    )
+    pytester.runpytest().assert_outcomes(passed=2)
+    assert pytester.path.joinpath(
+        ".pytest_cache", "v", "when", "stub_profile"
+    ).exists()
+
+    pytester.makepyfile(
+        "HOT = []\n" + ADAPTIVE_TEST_MODULE.format(calls=0, expected=[9, 8])
+    )
+    pytester.runpytest().assert_outcomes(passed=2)